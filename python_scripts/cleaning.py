@@ -0,0 +1,114 @@
+import re
+import time
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from . import helper
+
+
+########################
+# Shorten column names
+########################
+def short_cols(df: pd.DataFrame, symbol_replacement=""):
+    df.columns = df.columns.map(lambda col: short_col(col, symbol_replacement))
+    return df
+
+
+# Each distinct name is only shortened once per process
+@lru_cache(maxsize=None)
+def short_col(col: str, symbol_replacement=""):
+    col = col.strip().lower()
+    for old, new in _short_col_replacements:
+        col = col.replace(old, new)
+    col = _short_col_symbols.sub(symbol_replacement, col)
+    return _short_col_trailing_underscore.sub("", col)
+
+
+# Replacements made in turn to shorten column names, before replacing symbols
+_short_col_replacements = [
+    (" ", "_"),
+    (".", "_"),
+    ("pseudo_", ""),
+    ("vacancy_", "vac_"),
+    ("client_", "cli_"),
+    ("service_", "svc_"),
+    ("referral_", "ref_"),
+    ("trusted_assessment_", "tr_a_"),
+    ("_date", "_dt"),
+    ("_group", "_grp"),
+    ("orig_", "o_"),
+    ("how_does_applicant_define_their_gender", "gender"),
+]
+_short_col_symbols = re.compile("[^A-Za-z0-9_]")
+_short_col_trailing_underscore = re.compile("_$")
+
+
+#########################
+# Pad column categories
+#########################
+def col_padded(col: pd.Series):
+    return col.str.pad(width=max(col.dtype.categories.str.len()), side="right").astype(
+        "category"
+    )
+
+
+#########################################################
+# Parse date columns with an explicit day-first format
+#########################################################
+date_format = "%d/%m/%Y"
+
+
+def parse_dates(
+    df: pd.DataFrame,
+    date_formats: dict,
+    replacements: dict | None = None,
+    errors="raise",
+    verbose=False,
+):
+    # date_formats maps each column to its exact format and replacements maps
+    # columns to {invalid value: corrected value or pd.NaT}. Each distinct
+    # value is only parsed once. errors="ignore" leaves a column that can't be
+    # parsed as strings, as read_csv(parse_dates=...) does.
+    replacements = replacements or {}
+    start = time.perf_counter()
+    n_values = 0
+    for col, fmt in date_formats.items():
+        if col not in df.columns:
+            continue
+        df[col] = parse_date_col(df[col], fmt, replacements.get(col), errors)
+        n_values += len(df)
+    elapsed = time.perf_counter() - start
+    helper.log(
+        f"Parsed {n_values:,} dates in {elapsed:.2f}s"
+        f" ({n_values / max(elapsed, 1e-9):,.0f}/s)",
+        verbose=verbose,
+    )
+    return df
+
+
+def parse_date_col(
+    col: pd.Series, fmt=date_format, replacements: dict | None = None, errors="raise"
+):
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col
+    codes, uniques = pd.factorize(col)
+    uniques = pd.Series(uniques, dtype=object)
+    if replacements:
+        uniques = uniques.replace(replacements)
+    try:
+        parsed = pd.to_datetime(uniques, format=fmt)
+    except (ValueError, TypeError):
+        # Not all in the expected format: infer the format as before
+        try:
+            parsed = pd.to_datetime(
+                uniques,
+                dayfirst=True,
+                errors="coerce" if errors == "coerce" else "raise",
+            )
+        except (ValueError, TypeError):
+            if errors == "ignore":
+                return col
+            raise
+    # Missing values have code -1, which picks up the NaT appended at the end
+    values = np.append(parsed.to_numpy(dtype="datetime64[ns]"), np.datetime64("NaT"))
+    return pd.Series(values[codes], index=col.index, name=col.name)
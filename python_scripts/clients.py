@@ -1,5 +1,5 @@
 import pandas as pd
-from . import helper, setup
+from . import cleaning, setup
 from pathlib import Path
 
 pd.options.mode.copy_on_write = True
@@ -20,14 +20,12 @@ def _get_clients_real(basePath="./Original-CSVs", verbose=True, do_cleaning=True
     dir = Path(basePath)
     if verbose:
         print("Loading Clients.csv...")
-    df_cli = pd.read_csv(
-        dir / "Clients.csv",
-        dtype=df_cli_dtypes,
-        parse_dates=df_cli_dates,
-        dayfirst=True,
+    df_cli = pd.read_csv(dir / "Clients.csv", dtype=df_cli_dtypes)
+    df_cli = cleaning.parse_dates(
+        df_cli, df_cli_dates, errors="ignore", verbose=verbose
     )
     # Short column names
-    df_cli = helper.short_cols(df_cli)
+    df_cli = cleaning.short_cols(df_cli)
     # Order the categories with specified orders
     for col in df_cli.columns[df_cli.columns.isin(category_order)]:
         df_cli[col] = df_cli[col].cat.set_categories(category_order[col], ordered=True)
@@ -39,37 +37,24 @@ def _get_clients_real(basePath="./Original-CSVs", verbose=True, do_cleaning=True
     df_cli = df_cli[df_cli["test_clients"].isna()]
     # Clean the data
     if do_cleaning:
-        df_cli = clean_clients(df_cli)
+        df_cli = clean_clients(df_cli, verbose=verbose)
     return df_cli
 
 
 #################
 # Data cleaning
 #################
-def clean_clients(df_cli: pd.DataFrame):
-    # Fix error in Registration Date
-    df_cli.loc[df_cli["registration_dt"] == "05/11/1013", ["registration_dt"]] = (
-        "05/11/2013"
-    )
-    df_cli["registration_dt"] = pd.to_datetime(
-        df_cli["registration_dt"], dayfirst=True, errors="coerce"
-    )
-
-    # Fix multiple errors in Housing Status Date
-    df_cli["housing_status_dt"] = df_cli["housing_status_dt"].replace(
+def clean_clients(df_cli: pd.DataFrame, verbose=False):
+    # Fix errors in Registration Date and Housing Status Date, then parse them
+    df_cli = cleaning.parse_dates(
+        df_cli,
         {
-            # Repetitive, so likely entering a seemingly valid date to allow form entry:
-            "01/01/1011": pd.NaT,
-            "12/12/1210": pd.NaT,
-            # Unclear, but not relevant as the person has no placements:
-            "06/09/1010": pd.NaT,
-            # Likely typo, given context:
-            "20/12/1093": "20/12/2023",  # Reg and next assessment date 2023
-            "15/11/0018": "15/11/2018",  # Reg and next assessment date 2018
-        }
-    )
-    df_cli["housing_status_dt"] = pd.to_datetime(
-        df_cli["housing_status_dt"], dayfirst=True, errors="coerce"
+            "registration_dt": cleaning.date_format,
+            "housing_status_dt": cleaning.date_format,
+        },
+        replacements=df_cli_invalid_dates,
+        errors="coerce",
+        verbose=verbose,
     )
 
     ######################################################
@@ -97,6 +82,13 @@ def clean_clients(df_cli: pd.DataFrame):
     return df_cli
 
 
+######################################################
+# Source files: a change to any of these means this
+# dataset has to be reloaded from CSV
+######################################################
+source_files = ["Clients.csv"]
+
+
 #########################
 # Data types for fields
 #########################
@@ -163,13 +155,37 @@ df_cli_dtypes = {
 ##########################################
 # Fields which should be parsed as dates
 ##########################################
-df_cli_dates = [
-    # 'Registration Date',  # Exclude due to errors
-    # 'Housing Status Date', # Exclude due to errors
-    "Closed Date",
-    "Benefit Status Date",
-    "Next Assessment Date",
-]
+df_cli_dates = dict.fromkeys(
+    [
+        # 'Registration Date',  # Exclude due to errors
+        # 'Housing Status Date', # Exclude due to errors
+        "Closed Date",
+        "Benefit Status Date",
+        "Next Assessment Date",
+    ],
+    cleaning.date_format,
+)
+
+
+##############################################
+# Corrections to invalid dates, made before
+# parsing them: {column: {invalid: corrected}}
+##############################################
+df_cli_invalid_dates = {
+    # Fix error in Registration Date
+    "registration_dt": {"05/11/1013": "05/11/2013"},
+    # Fix multiple errors in Housing Status Date
+    "housing_status_dt": {
+        # Repetitive, so likely entering a seemingly valid date to allow form entry:
+        "01/01/1011": pd.NaT,
+        "12/12/1210": pd.NaT,
+        # Unclear, but not relevant as the person has no placements:
+        "06/09/1010": pd.NaT,
+        # Likely typo, given context:
+        "20/12/1093": "20/12/2023",  # Reg and next assessment date 2023
+        "15/11/0018": "15/11/2018",  # Reg and next assessment date 2018
+    },
+}
 
 
 ###############################################
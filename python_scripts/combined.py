@@ -1,8 +1,11 @@
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from collections import namedtuple
 from . import (
+    cleaning,
+    helper,
     vacancies,
+    vacancies_errors,
     clients,
     services,
     trusted_assessments,
@@ -11,6 +14,8 @@ from . import (
     setup,
 )
 from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+import sys
 
 pd.options.mode.copy_on_write = True
 _dfs_to_save_to_ramdisk = [
@@ -20,6 +25,36 @@ _dfs_to_save_to_ramdisk = [
     "svc",
     "tr_a",
 ]
+# Base dataframes produced by each dataset
+_dataset_dfs = {
+    "vacancies": ["vac", "vac_moved"],
+    "clients": ["cli"],
+    "services": ["svc"],
+    "trusted_assessments": ["tr_a"],
+}
+# Modules whose code loads and cleans each dataset. The first one lists the
+# dataset's source_files; it is only read when needed, as the dataset modules
+# may still be importing when this module is
+_dataset_modules = {
+    "vacancies": [vacancies, vacancies_errors, cleaning],
+    "clients": [clients, cleaning],
+    "services": [services, cleaning],
+    "trusted_assessments": [trusted_assessments, cleaning],
+}
+_derived_dfs = [
+    "f_service_use",
+    "f_placements",
+    "f_placements_corrected",
+]
+# Modules whose code determines the derived dataframes: a change to any of
+# them invalidates the derived dataframes cached on the RAM disk
+_derivation_modules = [
+    sys.modules[__name__],
+    helper,
+    services,
+    placements,
+    routes,
+]
 
 
 # Get dataframes from cache
@@ -31,50 +66,209 @@ def get_dataframes(basePath="./Original-CSVs", verbose=True):
 def _get_combined_dfs(df_dict: dict, verbose=False):
     if verbose:
         print("Combining datasets...")
-    # Combine datasets
-    df_dict["all"] = (
-        pd.merge(df_dict["vac"], df_dict["cli"], how="outer", on="cli_id")
-        .merge(df_dict["svc"], how="left", on="svc_id")
-        .merge(df_dict["tr_a"].reset_index(), how="left", on="cli_id")
+    # Plan the joins making 'all' on their keys, then filter the plan before
+    # joining the selected rows: 'all' itself is only made if it's used
+    plan = _plan_all(df_dict)
+    vac_id_notna = _plan_col(plan, df_dict["vac"]["vac_id"].notna(), "_vac", False)
+    o_cli_id = _plan_col(plan, df_dict["cli"]["o_cli_id"], "_cli")
+    # All service uses for people who have used adult pathways accommodation
+    in_adult_pathways = _plan_svc_type_mask(
+        df_dict, plan, services.SvcTypeFlag.ADULT_PATHWAYS
     )
-    # Get list of cli_ids who have used adult pathways accommodation
-    adultpathway_users = (
-        df_dict["all"]
-        .loc[
-            (
-                (df_dict["all"]["o_cli_id"].notna())
-                & (df_dict["all"]["vac_id"].notna())
-                & (
-                    df_dict["all"]["svc_type"].isin(
-                        services.adult_pathways_accom_svc_types
-                    )
-                )
-            ),
-            "o_cli_id",
-        ]
-        .drop_duplicates()
+    service_use = vac_id_notna & helper.cohort_mask(
+        o_cli_id, vac_id_notna & in_adult_pathways
+    )
+    df_dict["f_service_use"] = _join_planned_rows(df_dict, plan, service_use)
+    # The accommodation service uses among them
+    df_dict["f_placements"] = _join_planned_rows(
+        df_dict,
+        plan,
+        service_use & _plan_svc_type_mask(df_dict, plan, services.SvcTypeFlag.ACCOM),
     )
-    # Create dataset of all service uses for people who have used adult pathways accommodation
-    df_dict["f_service_use"] = df_dict["all"][
-        (df_dict["all"]["o_cli_id"].isin(adultpathway_users))
-        & (df_dict["all"]["vac_id"].notna())
-    ]
-    # Create dataset of accommodation service uses for people who have used adult pathways accommodation
-    df_dict["f_placements"] = df_dict["all"][
-        (df_dict["all"]["o_cli_id"].isin(adultpathway_users))
-        & (df_dict["all"]["vac_id"].notna())
-        & (df_dict["all"]["svc_type"].isin(services.accom_svc_types))
-    ]
     dffp = placements.get_placements(df_dict["f_placements"])
-    dffp = placements.eliminate_overlaps(dffp)
-    dffp = placements.reduce_gaps(dffp)
+    dffp = placements.correct_placements(dffp)
     dffp = routes.add_routes(dffp)
     df_dict["f_placements_corrected"] = dffp
     return df_dict
 
 
+# All datasets: vac/cli outer joined, svc left joined on svc_id and tr_a left
+# joined on cli_id
+def _get_all(df_dict: dict):
+    return (
+        pd.merge(df_dict["vac"], df_dict["cli"], how="outer", on="cli_id")
+        .merge(df_dict["svc"], how="left", on="svc_id")
+        .merge(df_dict["tr_a"].reset_index(), how="left", on="cli_id")
+    )
+
+
+# The joins making 'all', on the join keys only: one row per row of 'all', in
+# the same order, with the position of the vac, cli, svc and tr_a rows it's
+# joined from (-1 where there isn't one)
+def _plan_all(df_dict: dict):
+    def keys(name, key_cols):
+        frame = df_dict[name]
+        return pd.DataFrame(
+            dict((col, frame[col].array) for col in key_cols)
+            | {f"_{name}": np.arange(len(frame))}
+        )
+
+    plan = (
+        pd.merge(
+            keys("vac", ["cli_id", "svc_id"]),
+            keys("cli", ["cli_id"]),
+            how="outer",
+            on="cli_id",
+        )
+        .merge(keys("svc", ["svc_id"]), how="left", on="svc_id")
+        .merge(keys("tr_a", ["cli_id"]), how="left", on="cli_id")
+    )
+    return plan[_planned_dfs].fillna(-1).astype("int64")
+
+
+_planned_dfs = ["_vac", "_cli", "_svc", "_tr_a"]
+
+
+# A column of one of the datasets, as it would be in 'all'
+def _plan_col(plan: pd.DataFrame, col: pd.Series, position: str, fill_value=None):
+    return (
+        col.reset_index(drop=True)
+        .reindex(plan[position], fill_value=fill_value)
+        .set_axis(plan.index)
+    )
+
+
+# Whether each row of 'all' is at a service whose type has any of flags. Each
+# service is only tested once
+def _plan_svc_type_mask(
+    df_dict: dict, plan: pd.DataFrame, flags: "services.SvcTypeFlag"
+):
+    in_types = services.has_svc_type_flag(df_dict["svc"], flags)
+    return _plan_col(plan, in_types, "_svc", False)
+
+
+# The rows of 'all' selected by a mask over the plan, which must all have a
+# vacancy. They're joined in the same order, and have the same index labels
+# and dtypes, as they would in 'all'
+def _join_planned_rows(df_dict: dict, plan: pd.DataFrame, rows: pd.Series):
+    # Datasets missing from some rows of 'all' have their dtypes promoted there
+    # (e.g. bool to object), so promote them in the same way here
+    frames = {}
+    for name in ["vac", "cli", "svc", "tr_a"]:
+        frame = df_dict[name]
+        if (plan[f"_{name}"] < 0).any():
+            frame = frame.astype(frame.iloc[:0].reindex([0]).dtypes.to_dict())
+        frames[name] = frame
+    selected = plan[rows]
+    joined = (
+        pd.merge(
+            frames["vac"].iloc[pd.unique(selected["_vac"])],
+            frames["cli"],
+            how="left",
+            on="cli_id",
+        )
+        .merge(frames["svc"], how="left", on="svc_id")
+        .merge(frames["tr_a"].reset_index(), how="left", on="cli_id")
+    )
+    joined.index = selected.index
+    return joined
+
+
+#######################################################################
+# The dataframes, as attributes. Those in _lazy_dfs are only made when
+# they're first used, e.g. 'all', from the base dataframes
+#######################################################################
+class Struct:
+    def __init__(self, **dfs):
+        self.__dict__.update(dfs)
+
+    def __getattr__(self, name):
+        # Only called for attributes that haven't been set
+        if name in _lazy_dfs and all(
+            k in self.__dict__ for k in _dfs_to_save_to_ramdisk
+        ):
+            setattr(self, name, _lazy_dfs[name](self.__dict__))
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return f"Struct({', '.join(list(self.__dict__) + [k for k in _lazy_dfs if k not in self.__dict__])})"
+
+    # As a dict, without any lazy dataframes that haven't been made yet
+    def _asdict(self):
+        return dict(self.__dict__)
+
+
+_lazy_dfs = {"all": _get_all}
+
+
+# Columns tr_a keeps however it's projected: its index, and the key it's
+# joined to the other datasets on
+_tr_a_key_columns = ["tr_a_id", "cli_id"]
+
+
+# Columns to leave out of tr_a, and the frames combined from it, to keep only
+# tr_a_columns of it (None keeps them all)
+def _tr_a_columns_to_drop(all_tr_a_columns: list[str], tr_a_columns=None):
+    if tr_a_columns is None:
+        return []
+    unknown = set(tr_a_columns) - set(all_tr_a_columns) - set(_tr_a_key_columns)
+    if unknown:
+        raise KeyError(f"Unknown tr_a columns: {sorted(unknown)}")
+    keep = set(tr_a_columns) | set(_tr_a_key_columns)
+    return [col for col in all_tr_a_columns if col not in keep]
+
+
+# Keep only tr_a_columns of tr_a in tr_a and the frames combined from it
+def project_tr_a(df_dict: dict, tr_a_columns=None):
+    cols_to_drop = _tr_a_columns_to_drop(df_dict["tr_a"].columns.tolist(), tr_a_columns)
+    for k in ["tr_a"] + _derived_dfs:
+        if k in df_dict:
+            df_dict[k] = df_dict[k].drop(
+                columns=df_dict[k].columns.intersection(cols_to_drop)
+            )
+    return df_dict
+
+
+# Files a dataset depends on: its CSVs, the code that loads them and any data
+# files that code reads
+def _dataset_source_paths(dataset: str, basePath="./Original-CSVs"):
+    modules = _dataset_modules[dataset]
+    return (
+        [Path(basePath) / f for f in modules[0].source_files]
+        + [Path(module.__file__) for module in modules]
+        + [Path(f) for module in modules for f in getattr(module, "data_files", [])]
+    )
+
+
+# Load one base dataset from its CSV file(s)
+def _load_dataset(dataset: str, basePath, verbose=True, do_cleaning=True):
+    if dataset == "vacancies":
+        df_moved_vac, df_vac = vacancies._get_vacancies_real(
+            basePath, verbose, do_cleaning
+        )
+        return {"vac": df_vac, "vac_moved": df_moved_vac}
+    elif dataset == "clients":
+        return {"cli": clients._get_clients_real(basePath, verbose, do_cleaning)}
+    elif dataset == "services":
+        return {"svc": services._get_services_real(basePath, verbose, do_cleaning)}
+    elif dataset == "trusted_assessments":
+        return {
+            "tr_a": trusted_assessments._get_trusted_assessments_real(
+                basePath, verbose, do_cleaning
+            )
+        }
+    raise ValueError(f"Unknown dataset '{dataset}'")
+
+
 # Get dataframes
-def _get_dataframes_real(basePath="./Original-CSVs", verbose=True, do_cleaning=True):
+def _get_dataframes_real(
+    basePath="./Original-CSVs",
+    verbose=True,
+    do_cleaning=True,
+    unchanged_dfs: dict | None = None,
+    parallel: bool = False,
+):
     # Check that basePath exists
     dir = Path(basePath)
     if dir.exists() and dir.is_dir():
@@ -82,34 +276,51 @@ def _get_dataframes_real(basePath="./Original-CSVs", verbose=True, do_cleaning=T
     else:
         raise FileNotFoundError(f"Base path does not exist: '{basePath}'")
 
-    # Load base datasets
-    df_moved_vac, df_vac = vacancies._get_vacancies_real(basePath, verbose, do_cleaning)
-    df_cli = clients._get_clients_real(basePath, verbose, do_cleaning)
-    df_svc = services._get_services_real(basePath, verbose, do_cleaning)
-    df_tr_a = trusted_assessments._get_trusted_assessments_real(
-        basePath, verbose, do_cleaning
-    )
-
-    # Create dict
-    df_dict = {
-        "vac": df_vac,
-        "vac_moved": df_moved_vac,
-        "cli": df_cli,
-        "svc": df_svc,
-        "tr_a": df_tr_a,
-    }
+    # Load base datasets, reusing any passed in (e.g. unchanged since cached)
+    to_load = [
+        dataset
+        for dataset, dfs in _dataset_dfs.items()
+        if unchanged_dfs is None or not all(k in unchanged_dfs for k in dfs)
+    ]
+    if parallel and len(to_load) > 1:
+        # The datasets are independent until they're combined, so load them
+        # concurrently: reading over the network and parsing CSVs release
+        # the GIL, so the load takes as long as the slowest dataset
+        with ThreadPoolExecutor(max_workers=len(to_load)) as executor:
+            futures = dict(
+                (
+                    dataset,
+                    executor.submit(
+                        _load_dataset, dataset, basePath, verbose, do_cleaning
+                    ),
+                )
+                for dataset in to_load
+            )
+        loaded = dict((dataset, future.result()) for dataset, future in futures.items())
+    else:
+        loaded = dict(
+            (dataset, _load_dataset(dataset, basePath, verbose, do_cleaning))
+            for dataset in to_load
+        )
+    df_dict = {}
+    for dataset, dfs in _dataset_dfs.items():
+        if dataset in loaded:
+            df_dict.update(loaded[dataset])
+        else:
+            helper.log(f"Reusing unchanged {dataset} data", verbose=verbose)
+            df_dict.update((k, unchanged_dfs[k]) for k in dfs)
 
     # Add combined dfs to dict
     df_dict = _get_combined_dfs(df_dict, verbose)
 
     if verbose:
-        print("Done. Returning named tuple with pandas dataframes:")
+        print("Done. Returning Struct with pandas dataframes:")
         print("  vac: Vacancies")
         print("  cli: People who have used services")
         print("  svc: Services")
         print("  tr_a: Trusted Assessment forms")
         print(
-            "  all_merged: All datasets, vac/cli outer joined, others left joined on cli_id."
+            "  all: All datasets, vac/cli outer joined, others left joined on cli_id (made when first used)."
         )
         print(
             "  f_serviceuse: Filter of merged datasets: ",
@@ -134,4 +345,4 @@ def _get_dataframes_real(basePath="./Original-CSVs", verbose=True, do_cleaning=T
         print("-----")
         print("Example usage: df.f_placements.svc_type.value_counts()")
 
-    return namedtuple("Struct", df_dict)(**df_dict)
+    return Struct(**df_dict)
@@ -1,6 +1,6 @@
+import numpy as np
 import pandas as pd
-from . import services, setup, routes
-
+from . import services, setup, routes, placements
 
 dpw_start_dt = pd.Timestamp("2017-10-28")
 dpw_end_dt = pd.Timestamp("2025-04-30")
@@ -63,9 +63,83 @@ stable_reasons = [
 ]
 
 
+##############################################################################
+# Returns after routes end, for all of stable_offsets at once. The time from
+# the end of each route to the start of the person's next route (or to
+# dpw_end_dt after their last route) is found once, then compared with the
+# length of each period from the route's end: "No" if the period ends before
+# it, otherwise "Yes" (or "Not yet..." after their last route). Routes that
+# haven't ended are NA. Periods in months and years vary in length, so they're
+# measured from each distinct end date. One row per route, as routes.get_routes.
+# adj is dpw_pls's adjacency, if it's already been made
+##############################################################################
+def get_route_returns(dpw_pls, adj: placements.Adjacency | None = None):
+    if adj is None:
+        adj = placements.Adjacency(dpw_pls)
+    ends = adj.route_ends - 1
+    end_dt = dpw_pls.pl_end_dt.to_numpy(dtype="datetime64[ns]")[ends]
+    is_last = np.isin(adj.route_ends, adj.person_ends)
+    next_start_dt = np.where(
+        is_last,
+        np.datetime64(dpw_end_dt, "ns"),
+        dpw_pls.pl_start_dt.to_numpy(dtype="datetime64[ns]")[
+            np.minimum(adj.route_ends, len(dpw_pls) - 1)
+        ],
+    )
+    until_next = next_start_dt - end_dt
+    ended = ~np.isnat(end_dt)
+    end_dts, end_dt_codes = np.unique(end_dt[ended], return_inverse=True)
+    end_dts = pd.DatetimeIndex(end_dts)
+    returns = {"rt_end_dt": end_dt, "until_next": until_next, "is_last": is_last}
+    for period, offset in stable_offsets.items():
+        period_length = np.full(len(ends), np.timedelta64("NaT"), dtype="m8[ns]")
+        period_lengths = ((end_dts + offset) - end_dts).to_numpy()
+        period_length[ended] = period_lengths[end_dt_codes]
+        outcome = np.where(
+            period_length < until_next, "No", np.where(is_last, "Not yet...", "Yes")
+        ).astype(object)
+        outcome[~ended] = pd.NA
+        returns[f"after_rt_ret_within_{period}"] = outcome
+    return pd.DataFrame(
+        returns,
+        index=pd.Index(dpw_pls.route_id.iloc[adj.route_starts], name="route_id"),
+    )
+
+
+# Counts of the return outcomes of route ends (the last placements of routes,
+# with the columns added by get_distinct_pathways_routes) by group, for all
+# of stable_offsets at once. Route ends at least the period before
+# dpw_end_dt are eligible for it: ">=t" counts them and "Yes" and "No" their
+# outcomes. "<t" counts the rest and "<t ret" those of them that returned
+return_count_stats = ["<t", ">=t", "<t ret", "Yes", "No"]
+
+
+def count_route_returns(route_ends: pd.DataFrame, by: str):
+    counts = {}
+    for period, offset in stable_offsets.items():
+        max_end_dt = dpw_end_dt - offset
+        eligible = (route_ends.pl_end_dt < max_end_dt).to_numpy()
+        outcome = route_ends[f"after_rt_ret_within_{period}"]
+        returned = (outcome == "Yes").fillna(False).to_numpy(dtype=bool)
+        counts[period, "<t"] = (route_ends.pl_end_dt >= max_end_dt).to_numpy()
+        counts[period, ">=t"] = eligible
+        counts[period, "<t ret"] = counts[period, "<t"] & returned
+        counts[period, "Yes"] = eligible & returned
+        counts[period, "No"] = eligible & (outcome == "No").fillna(False).to_numpy(
+            dtype=bool
+        )
+    return (
+        pd.DataFrame(counts)
+        .groupby(route_ends[by].to_numpy())
+        .sum()
+        .rename_axis(by)
+        .astype("Int64")
+    )
+
+
 def get_distinct_pathways_routes(dffp):
     dpw_pls = dffp[
-        dffp.svc_type.isin(services.distinct_pathways_accom_svc_types)
+        services.has_svc_type_flag(dffp, services.SvcTypeFlag.DISTINCT_PATHWAYS)
         & (dffp.pl_start_dt <= dpw_end_dt)
         & (
             (dffp.pl_end_dt >= dpw_start_dt)  # Ended since DPW started
@@ -79,62 +153,36 @@ def get_distinct_pathways_routes(dffp):
     # Add a unique identifier for each route (contiguous journey through supported housing services)
     dpw_pls = setup.add_routes(dpw_pls)
 
-    end_categories = routes.get_end_cats_map()
-    dpw_pls["rt_end_cat"] = (
-        dpw_pls.pl_end_reason.map(end_categories)
-        .fillna("[Not ended or invalid end reason]")
-        .where(dpw_pls.vac_id.isin(dpw_pls.groupby("route_id").tail(1).vac_id))
-        .groupby([dpw_pls.o_cli_id, dpw_pls.route_id])
-        .bfill()
+    # The end category of each route, in every placement of the route, and
+    # whether it was planned, in the route's last placement
+    adj = placements.Adjacency(dpw_pls)
+    last_rows = adj.route_ends - 1
+    route_of_row = np.repeat(
+        np.arange(len(last_rows)), adj.route_ends - adj.route_starts
     )
-    end_planned = routes.get_is_planned_map()
-    dpw_pls["rt_end_planned"] = dpw_pls.pl_end_reason.map(end_planned).where(
-        dpw_pls.vac_id.isin(dpw_pls.groupby("route_id").tail(1).vac_id)
-        .groupby([dpw_pls.o_cli_id, dpw_pls.route_id])
-        .bfill()
+    route_ends = np.zeros(len(dpw_pls), dtype=bool)
+    route_ends[last_rows] = True
+    end_cats = (
+        routes.get_end_cats(dpw_pls.pl_end_reason)
+        .astype(object)
+        .fillna("[Not ended or invalid end reason]")
     )
+    dpw_pls["rt_end_cat"] = end_cats.to_numpy()[last_rows][route_of_row]
+    end_planned = routes.get_is_planned(dpw_pls.pl_end_reason).astype(object)
+    dpw_pls["rt_end_planned"] = end_planned.where(route_ends)
     dpw_pls = setup.drop_added_cols(dpw_pls)
     dpw_pls = setup.sort_values_and_add_cols(dpw_pls)
 
-    next_pl_start_dt = dpw_pls.pl_start_dt.shift(-1).where(
-        dpw_pls.o_cli_id == dpw_pls.o_cli_id.shift(-1)
-    )
-    route_end_vacids = (
-        dpw_pls.groupby(["o_cli_id", "route_id"])
-        .tail(1)[lambda t: ~t.pl_end_dt.isna()]
-        .vac_id
-    )
-    last_route_end_vacids = (
-        dpw_pls.groupby(["o_cli_id"]).tail(1)[lambda t: ~t.pl_end_dt.isna()].vac_id
-    )
-    last_route_ends = dpw_pls.vac_id.isin(last_route_end_vacids)
-    notlast_route_ends = dpw_pls.vac_id.isin(route_end_vacids) & ~dpw_pls.vac_id.isin(
-        last_route_end_vacids
-    )
-    stable_route_ends = dpw_pls.vac_id.isin(route_end_vacids) & dpw_pls.rt_end_cat.isin(
-        stable_reasons
-    )
-    last_stable_route_ends = stable_route_ends & dpw_pls.vac_id.isin(
-        last_route_end_vacids
-    )
-    notlast_stable_route_ends = stable_route_ends & ~dpw_pls.vac_id.isin(
-        last_route_end_vacids
+    # Whether the person returned within each of stable_offsets of the end of
+    # each route, in every placement of the route
+    adj = placements.Adjacency(dpw_pls)
+    route_returns = get_route_returns(dpw_pls, adj)
+    route_of_row = np.repeat(
+        np.arange(len(route_returns)), adj.route_ends - adj.route_starts
     )
     for period in stable_offsets:
-        # ends of routes where the end reason is in the list of stable reasons
-        # and either the next route after starts after the offset, or it's the most
-        # recent route and it ends on a date greater than the offest before 30/4/25
         col = f"after_rt_ret_within_{period}"
-        dpw_pls[col] = pd.NA
-        dpw_pls.loc[notlast_route_ends, col] = (
-            (dpw_pls.pl_end_dt + stable_offsets[period]) < next_pl_start_dt
-        ).map({True: "No", False: "Yes"})
-        dpw_pls.loc[last_route_ends, col] = (
-            (dpw_pls.pl_end_dt + stable_offsets[period]) < dpw_end_dt
-        ).map({True: "No", False: "Not yet..."})
-        dpw_pls[col] = (
-            dpw_pls[col].groupby([dpw_pls.o_cli_id, dpw_pls.route_id]).bfill()
-        )
+        dpw_pls[col] = route_returns[col].to_numpy()[route_of_row]
 
     shorttypelvls_base = {
         "Mixed Pathway": "M/F",
@@ -150,18 +198,17 @@ def get_distinct_pathways_routes(dffp):
     dpw_pls["svc_typelvl"] = dpw_pls.svc_type_short.astype(
         "string"
     ) + dpw_pls.pathway_level.str.replace(r"^(\d)", r" L\1", regex=True).fillna("")
-    dpw_pls["prev_svc_typelvl"] = dpw_pls.prev_svc_type_short.astype(
+    prev_svc_type_short = dpw_pls.prev["svc_type_short"]
+    dpw_pls["prev_svc_typelvl"] = prev_svc_type_short.astype(
         "string"
     ) + dpw_pls.prev_pathway_level.str.replace(r"^(\d)", r" L\1", regex=True).fillna("")
     for col in ["svc_typelvl", "prev_svc_typelvl"]:
         dpw_pls[col] = dpw_pls[col].map(shorttypelvls)
 
     dpw_pls["svc_lvls"] = dpw_pls.svc_apwlvl.astype("string")
-    dpw_pls["prev_svc_lvls"] = dpw_pls.prev_svc_apwlvl.astype("string")
+    dpw_pls["prev_svc_lvls"] = dpw_pls.prev["svc_apwlvl"].astype("string")
     for typ in ["Emergency L1", "High Support L2", "Medium Support L3"]:
         dpw_pls.loc[dpw_pls.svc_type_short == typ, "svc_lvls"] = "EHM_" + typ[-1:]
-        dpw_pls.loc[dpw_pls.prev_svc_type_short == typ, "prev_svc_lvls"] = (
-            "EHM_" + typ[-1:]
-        )
+        dpw_pls.loc[prev_svc_type_short == typ, "prev_svc_lvls"] = "EHM_" + typ[-1:]
 
     return dpw_pls
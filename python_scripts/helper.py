@@ -1,42 +1,9 @@
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
 
-########################
-# Shorten column names
-########################
-def short_cols(df: pd.DataFrame, symbol_replacement=""):
-    df.columns = (
-        df.columns.str.strip()
-        .str.lower()
-        .str.replace(" ", "_")
-        .str.replace(".", "_")
-        .str.replace("pseudo_", "")
-        .str.replace("vacancy_", "vac_")
-        .str.replace("client_", "cli_")
-        .str.replace("service_", "svc_")
-        .str.replace("referral_", "ref_")
-        .str.replace("trusted_assessment_", "tr_a_")
-        .str.replace("_date", "_dt")
-        .str.replace("_group", "_grp")
-        .str.replace("orig_", "o_")
-        .str.replace("how_does_applicant_define_their_gender", "gender")
-        .str.replace("[^A-Za-z0-9_]", symbol_replacement, regex=True)
-        .str.replace("_$", "", regex=True)
-    )
-    return df
-
-
-#########################
-# Pad column categories
-#########################
-def col_padded(col: pd.Series):
-    return col.str.pad(width=max(col.dtype.categories.str.len()), side="right").astype(
-        "category"
-    )
-
-
 #########################################################
 # Remove unused categories from all categorical columns
 #########################################################
@@ -132,6 +99,53 @@ def get_snapshot(df_placements: pd.DataFrame, start_date, end_date=None, filter=
     return dffp[filter]
 
 
+##############################################################################
+# Snapshots of many dates at once, as one long frame: the rows get_snapshot
+# would return for each date, in turn, with the date as snapshot_dt. The
+# dates a placement is in are consecutive once the dates are sorted, so
+# they're found with two binary searches per placement rather than a scan of
+# the placements per date
+##############################################################################
+def get_snapshots(df_placements: pd.DataFrame, dates, filter=None):
+    dffp = df_placements
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    order = np.argsort(dates, kind="stable")
+    sorted_dates = dates[order].to_numpy(dtype="datetime64[ns]")
+    start = dffp.pl_start_dt.to_numpy(dtype="datetime64[ns]")
+    end = dffp.pl_end_dt.to_numpy(dtype="datetime64[ns]")
+    # Started on or before the date, and ended on or after it or still open
+    first = np.searchsorted(sorted_dates, start, "left")
+    last = np.where(
+        np.isnat(end), len(dates), np.searchsorted(sorted_dates, end, "right")
+    )
+    n_dates = np.where(np.isnat(start), 0, np.maximum(last - first, 0))
+    if filter is not None:
+        n_dates[~filter.to_numpy(dtype=bool)] = 0
+    positions = np.repeat(np.arange(len(dffp)), n_dates)
+    # Each placement's dates, in sorted order, then in the order they were given
+    runs = np.cumsum(n_dates) - n_dates
+    date_positions = order[np.arange(len(positions)) - np.repeat(runs - first, n_dates)]
+    by_date = np.argsort(date_positions, kind="stable")
+    return dffp.iloc[positions[by_date]].assign(
+        snapshot_dt=dates[date_positions[by_date]]
+    )
+
+
+##############################################################################
+# Cohorts: a row is in the cohort if any row of the same person qualifies.
+# One grouped reduction over the people's integer codes; rows without a
+# person are never in a cohort. E.g. the rows of people who have used distinct
+# pathways accommodation:
+#   cohort_mask(dffp.o_cli_id, has_svc_type_flag(dffp, DISTINCT_PATHWAYS))
+##############################################################################
+def cohort_mask(people: pd.Series, qualifying: pd.Series):
+    codes, uniques = pd.factorize(people)
+    has_person = codes >= 0
+    qualified = np.zeros(len(uniques), dtype=bool)
+    qualified[codes[qualifying.to_numpy(dtype=bool) & has_person]] = True
+    return pd.Series(has_person & qualified[codes], index=people.index)
+
+
 #################################################################
 # Logging function: flexible approach in case of future changes
 #################################################################
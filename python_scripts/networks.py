@@ -1,152 +1,228 @@
+import numpy as np
 import pandas as pd
-from . import services, distinct_pathways
+from . import services, distinct_pathways, placements
 
 
+##############################################################################
+# Adjacency and edge lists of the moves between nodes (the values of each of
+# nodetypes, the route end categories and the entry and exit nodes). Each
+# placement is classified once as an extant or new entry, a final exit, a
+# reentry or a move; its edges are pairs of node codes for all the nodetypes
+# at once, and the moves along them are counted for all the nodetypes with
+# one bincount over (nodetype, source, target) keys
+##############################################################################
 def mkAdjEdgeLists(dffp, nw_df, nodetypes):
     dpw_start_dt = distinct_pathways.dpw_start_dt
     known_apw = dffp.loc[
-        dffp.svc_type.isin(services.adult_pathways_accom_svc_types)
+        services.has_svc_type_flag(dffp, services.SvcTypeFlag.ADULT_PATHWAYS)
         & (dffp.pl_end_dt < dpw_start_dt),
         "o_cli_id",
     ]
     known_others = dffp.loc[
         (
-            (dffp.svc_type.isin(services.accom_svc_types))
+            services.has_svc_type_flag(dffp, services.SvcTypeFlag.ACCOM)
             & (dffp.pl_end_dt < dpw_start_dt)
             & (~dffp.o_cli_id.isin(known_apw))
         ),
         "o_cli_id",
     ]
-    extant = nw_df.groupby("o_cli_id").head(1)[lambda x: x.pl_start_dt < dpw_start_dt]
-    entries = nw_df.groupby("o_cli_id").head(1)[lambda x: x.pl_start_dt >= dpw_start_dt]
-    entries_new = entries[~entries.o_cli_id.isin(pd.concat([known_apw, known_others]))]
-    entries_apw = entries[entries.o_cli_id.isin(known_apw)]
-    entries_others = entries[entries.o_cli_id.isin(known_others)]
-    final_exits = nw_df.groupby(["o_cli_id"]).tail(1)[
-        lambda x: x.pl_end_dt > dpw_start_dt
-    ]
+    adj = placements.Adjacency(nw_df)
+    started = (nw_df.pl_start_dt >= dpw_start_dt).to_numpy(dtype=bool)
+    person_start = np.zeros(len(nw_df), dtype=bool)
+    person_start[adj.person_starts] = True
+    person_end = np.zeros(len(nw_df), dtype=bool)
+    person_end[adj.person_ends - 1] = True
+    route_start = np.zeros(len(nw_df), dtype=bool)
+    route_start[adj.route_starts] = True
+    extant = person_start & (nw_df.pl_start_dt < dpw_start_dt).to_numpy(dtype=bool)
+    entries = person_start & started
+    entries_apw = entries & nw_df.o_cli_id.isin(known_apw).to_numpy(dtype=bool)
+    entries_others = entries & nw_df.o_cli_id.isin(known_others).to_numpy(dtype=bool)
+    entries_new = entries & ~entries_apw & ~entries_others
+    final_exits = person_end & (nw_df.pl_end_dt > dpw_start_dt).to_numpy(dtype=bool)
     # For re-entries, the route_id changes for the same o_cli_id
-    nw_df_prev = nw_df.shift(1)
-    reentries = nw_df[
-        (nw_df.o_cli_id == nw_df_prev.o_cli_id)
-        & (nw_df.route_id != nw_df_prev.route_id)
-        & (nw_df.pl_start_dt >= dpw_start_dt)
-    ].assign(prev_rt_end_cat=nw_df_prev.rt_end_cat)
-    # Moves are all rows except entries/reentries (the first row in each route)
-    # and each row contains details from the previous row for the same person
-    moves = nw_df.groupby(["o_cli_id", "route_id"]).tail(-1)[
-        lambda x: x.pl_start_dt >= dpw_start_dt
+    reentries = (
+        (adj.prev_pos >= 0)
+        & (nw_df.route_id != adj.prev(nw_df.route_id))
+        .fillna(False)
+        .to_numpy(dtype=bool)
+        & started
+    )
+    # Moves are all rows except entries/reentries (the first row in each route),
+    # except where the move was within the same service
+    moves = (
+        ~route_start
+        & started
+        & nw_df.prev_svc_id.notna().to_numpy(dtype=bool)
+        & (nw_df.svc_id != nw_df.prev_svc_id).fillna(False).to_numpy(dtype=bool)
+    )
+
+    # The edges of each kind of row, from the row's node ("node"), previous
+    # node ("prev_node"), route end category ("end_cat"), previous route's end
+    # category ("prev_end_cat") or a fixed node
+    edge_kinds = [
+        (extant, "EXTANT", "node"),
+        (entries_new, "ENTRY", "New"),
+        (entries_new, "New", "node"),
+        (entries_apw, "ENTRY", "Known (adult pw)"),
+        (entries_apw, "Known (adult pw)", "node"),
+        (entries_others, "Known (other)", "node"),
+        (entries_others, "ENTRY", "Known (other)"),
+        (final_exits, "node", "end_cat"),
+        (final_exits, "end_cat", "END"),
+        (reentries, "prev_node", "prev_end_cat"),
+        (reentries, "prev_end_cat", "RETURN"),
+        (reentries, "_RETURN", "node"),
+        (moves, "prev_node", "node"),
     ]
+    fixed_nodes = set(
+        endpoint
+        for _, source, target in edge_kinds
+        for endpoint in [source, target]
+        if endpoint not in _row_nodes
+    )
+    nodes, codes = _encode_nodes(nw_df, adj, nodetypes, fixed_nodes)
+    n_nodes = max(len(nodes_et) for nodes_et in nodes) if nodes else 0
 
-    edges_df = {}
-    for et in nodetypes:
-        prev_et = "prev_" + et
-
-        nodedfs = []
-        # Add all existing people
-        if not extant.empty:
-            nodedfs.append(
-                extant.assign(start="EXTANT").rename(columns={et: "end"})[
-                    ["start", "end"]
-                ]
-            )
-        # Add all entries
-        if not entries_new.empty:
-            nodedfs.append(
-                entries_new.assign(start="ENTRY", end="New")[["start", "end"]]
-            )
-            nodedfs.append(
-                entries_new.assign(start="New").rename(columns={et: "end"})[
-                    ["start", "end"]
-                ]
-            )
-        if not entries_apw.empty:
-            nodedfs.append(
-                entries_apw.assign(start="ENTRY", end="Known (adult pw)")[
-                    ["start", "end"]
-                ]
-            )
-            nodedfs.append(
-                entries_apw.assign(start="Known (adult pw)").rename(
-                    columns={et: "end"}
-                )[["start", "end"]]
-            )
-        if not entries_others.empty:
-            nodedfs.append(
-                entries_others.assign(start="Known (other)").rename(
-                    columns={et: "end"}
-                )[["start", "end"]]
-            )
-            nodedfs.append(
-                entries_others.assign(start="ENTRY", end="Known (other)")[
-                    ["start", "end"]
-                ]
-            )
-        # Add all exits
-        if not final_exits.empty:
-            nodedfs.append(
-                final_exits.rename(columns={et: "start", "rt_end_cat": "end"})[
-                    ["start", "end"]
-                ]
-            )
-            nodedfs.append(
-                final_exits.assign(end="END").rename(columns={"rt_end_cat": "start"})[
-                    ["start", "end"]
-                ]
-            )
-        # Add moves back from EXIT to ENTRY and then onwards for reentries
-        if not reentries.empty:
-            nodedfs.append(
-                reentries.rename(
-                    columns={"prev_" + et: "start", "prev_rt_end_cat": "end"}
-                )[["start", "end"]]
-            )
-            nodedfs.append(
-                reentries.rename(columns={"prev_rt_end_cat": "start"}).assign(
-                    end="RETURN"
-                )[["start", "end"]]
-            )
-            # reentries.assign(start="_RETURN", end="_"+reentries.prev_rt_end_cat)[["start", "end"]],
-            # reentries.assign(start="_"+reentries.prev_rt_end_cat, end=reentries[et])[["start", "end"]],
-            nodedfs.append(
-                reentries.assign(start="_RETURN").rename(columns={et: "end"})[
-                    ["start", "end"]
-                ]
-            )
-        # Add all other moves except where the move was within the same service
-        if not moves.empty:
-            nodedfs.append(
-                moves[
-                    (~moves.prev_svc_id.isnull()) & (moves.svc_id != moves.prev_svc_id)
-                ].rename(columns={prev_et: "start", et: "end"})[["start", "end"]]
-            )
-
-        if len(nodedfs) > 0:
-            edges_df[et] = pd.concat(nodedfs)
-        else:
-            edges_df[et] = pd.DataFrame(columns=["start", "end"])
+    def endpoint_codes(endpoint, rows):
+        if endpoint in _row_nodes:
+            return codes[endpoint][:, rows]
+        return np.repeat(codes[endpoint], rows.sum(), axis=1)
+
+    nodetype_offsets = np.arange(len(nodetypes))[:, None] * n_nodes
+    keys = np.concatenate(
+        [
+            (
+                (nodetype_offsets + endpoint_codes(source, rows)) * n_nodes
+                + endpoint_codes(target, rows)
+            ).ravel()
+            for rows, source, target in edge_kinds
+        ]
+    )
+    counts = np.bincount(keys, minlength=len(nodetypes) * n_nodes**2).reshape(
+        len(nodetypes), n_nodes**2
+    )
 
     adj_lists = {}
-    for et in nodetypes:
-        adj = (
-            edges_df[et]
-            .fillna("OTHER")
-            .groupby(["start", "end"], dropna=False)
-            .size()
-            .to_frame()
-        )
-        adj_list = adj.reset_index().rename(
-            columns={"start": "source", "end": "target", 0: "weight"}
+    edge_lists = {}
+    for i, et in enumerate(nodetypes):
+        # In (source, target) order, as groupby would sort them
+        pairs = np.flatnonzero(counts[i])
+        adj_list = pd.DataFrame(
+            {
+                "source": nodes[i].take(pairs // n_nodes).to_numpy(dtype=object),
+                "target": nodes[i].take(pairs % n_nodes).to_numpy(dtype=object),
+                "weight": counts[i, pairs],
+            }
         )
-        # adj_list = adj_list[adj_list.weight >= min_threshold]
         adj_list["n"] = adj_list["weight"]
         adj_lists[et] = adj_list
+        edge_lists[et] = adj_list.copy()
+        edge_lists[et].weight = adj_list.weight / adj_list.groupby("source")[
+            "weight"
+        ].transform("sum")
 
-    edge_lists = {}
+    return adj_lists, edge_lists
+
+
+_row_nodes = ["node", "prev_node", "end_cat", "prev_end_cat"]
+
+
+# Codes of each row's nodes, and of the fixed nodes, for each nodetype: arrays
+# with a row per nodetype. Each nodetype's nodes are its labels in sorted order
+# (numbers before strings), as groupby would sort them, so the codes sort in
+# the same order. Missing nodes are "OTHER"
+def _encode_nodes(nw_df, adj, nodetypes, fixed_nodes):
+    fixed_nodes = sorted(set(fixed_nodes) | {"OTHER"})
+    end_cat = nw_df.rt_end_cat.astype(object).to_numpy()
+    prev_end_cat = adj.prev(nw_df.rt_end_cat).astype(object).to_numpy()
+    nodes = []
+    codes = dict((k, []) for k in _row_nodes + fixed_nodes)
     for et in nodetypes:
-        edge_lists[et] = adj_lists[et].copy()
-        edge_lists[et].weight = (
-            adj_lists[et].groupby("source")["weight"].transform(lambda x: x / x.sum())
+        row_nodes = {
+            "node": nw_df[et].astype(object).to_numpy(),
+            "prev_node": nw_df["prev_" + et].astype(object).to_numpy(),
+            "end_cat": end_cat,
+            "prev_end_cat": prev_end_cat,
+        }
+        labels = np.concatenate(
+            [np.array(fixed_nodes, dtype=object)] + [row_nodes[k] for k in _row_nodes]
         )
+        label_codes, nodes_et = pd.factorize(labels, sort=True)
+        nodes_et = pd.Index(nodes_et, dtype=object)
+        label_codes[label_codes < 0] = nodes_et.get_loc("OTHER")
+        nodes.append(nodes_et)
+        for k, code in zip(fixed_nodes, label_codes):
+            codes[k].append(code)
+        offset = len(fixed_nodes)
+        for k in _row_nodes:
+            codes[k].append(label_codes[offset : offset + len(nw_df)])
+            offset += len(nw_df)
+    codes = dict(
+        (k, np.array(v, dtype="int64").reshape(len(nodetypes), -1))
+        for k, v in codes.items()
+    )
+    return nodes, codes
 
-    return adj_lists, edge_lists
+
+##############################################################################
+# Transition matrices: an adjacency list of mkAdjEdgeLists as a matrix of the
+# proportions of moves from each node (row) to each node (column), with the
+# nodes (labels, in order of appearance) giving the rows' and columns'
+# positions. Nodes without moves out have rows of zeros
+##############################################################################
+def get_transition_matrix(adj_list: pd.DataFrame):
+    nodes = pd.Index(pd.unique(adj_list[["source", "target"]].to_numpy().ravel()))
+    sources = nodes.get_indexer(adj_list.source)
+    targets = nodes.get_indexer(adj_list.target)
+    counts = np.bincount(
+        sources * len(nodes) + targets,
+        weights=adj_list.n.to_numpy(dtype="float64"),
+        minlength=len(nodes) ** 2,
+    ).reshape(len(nodes), len(nodes))
+    totals = counts.sum(axis=1, keepdims=True)
+    return nodes, np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+
+
+##############################################################################
+# Flows to exits, as an absorbing chain: the exits (route end categories, the
+# nodes moved from to END or RETURN) absorb, as do nodes without moves out.
+# For each other node, the probability of reaching each exit from it, and
+# the expected number of moves before reaching one, from linear solves over
+# all of them at once. Nodes that can't reach an absorbing node (e.g. A <-> B
+# in a filtered frame) are never absorbed: their flows are NaN, as are the
+# expected moves from any node that can reach them. One DataFrame per
+# nodetype in adj_lists
+##############################################################################
+def get_exit_flows(adj_lists: dict):
+    return dict((et, _exit_flows(adj_list)) for et, adj_list in adj_lists.items())
+
+
+def _exit_flows(adj_list: pd.DataFrame):
+    nodes, P = get_transition_matrix(adj_list)
+    exits = nodes.isin(adj_list.source[adj_list.target.isin(["END", "RETURN"])])
+    absorbing = exits | (P.sum(axis=1) == 0)
+    transient = ~absorbing
+    solvable = transient & _reaches(P, absorbing)
+    # I - Q, for the moves between transient nodes that are absorbed
+    fundamental = np.eye(solvable.sum()) - P[np.ix_(solvable, solvable)]
+    flows = np.full((transient.sum(), exits.sum() + 1), np.nan)
+    flows[solvable[transient]] = np.linalg.solve(
+        fundamental,
+        np.column_stack([P[np.ix_(solvable, exits)], np.ones(solvable.sum())]),
+    )
+    flows[_reaches(P, transient & ~solvable)[transient], -1] = np.nan
+    return pd.DataFrame(
+        flows,
+        index=nodes[transient].rename("node"),
+        columns=nodes[exits].append(pd.Index(["expected_moves"])),
+    )
+
+
+# The nodes from which any of the nodes in reached can be reached by moves
+def _reaches(P: np.ndarray, reached: np.ndarray):
+    while True:
+        reaches = reached | (P[:, reached] > 0).any(axis=1)
+        if (reaches == reached).all():
+            return reached
+        reached = reaches
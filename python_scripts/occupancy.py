@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+
+##############################################################################
+# Occupancy: how many rows' [start, end) intervals cover each of a sorted
+# sequence of days, per group. A sweep over the days: each interval adds +1 at
+# the first day on or after its start and -1 at the first day on or after its
+# end, and the counts are the running sums of these. Rows with a missing start
+# are never counted and rows with a missing end are still open. by groups the
+# rows as for groupby, e.g. by="svc_id" or by=["svc_typelvl", "pathway"]
+##############################################################################
+def nightly_counts(
+    df: pd.DataFrame, days, by=None, start="pl_start_dt", end="pl_end_dt"
+):
+    return _nightly(days, [(1, _ns(df[start]), _ns(df[end], open=True))], df, by)
+
+
+# Nightly stays (placed in the vacancy) and voids (the vacancy is open but
+# nobody is placed in it), per group. A night is a void if it's in the
+# vacancy but not the placement: the vacancy's count less the count of the
+# placement's overlap with it
+def nightly_stays_and_voids(
+    df: pd.DataFrame,
+    days,
+    by=None,
+    vac_start="vac_start_dt",
+    vac_end="vac_end_dt",
+    pl_start="pl_start_dt",
+    pl_end="pl_end_dt",
+):
+    vac_start, vac_end = _ns(df[vac_start]), _ns(df[vac_end], open=True)
+    pl_start, pl_end = _ns(df[pl_start]), _ns(df[pl_end], open=True)
+    overlap_start = np.where(
+        (vac_start == _NaT) | (pl_start == _NaT),
+        _NaT,
+        np.maximum(vac_start, pl_start),
+    )
+    overlap_end = np.minimum(vac_end, pl_end)
+    return pd.concat(
+        {
+            "stays": _nightly(days, [(1, pl_start, pl_end)], df, by),
+            "voids": _nightly(
+                days,
+                [(1, vac_start, vac_end), (-1, overlap_start, overlap_end)],
+                df,
+                by,
+            ),
+        },
+        axis=1,
+    )
+
+
+_NaT = np.iinfo("int64").min
+_open = np.iinfo("int64").max
+
+
+# Dates as int64 nanoseconds: missing starts as _NaT and (with open=True)
+# missing ends as _open, which sort before and after all dates respectively
+def _ns(col, open=False):
+    ns = pd.to_datetime(col).to_numpy(dtype="datetime64[ns]").view("int64")
+    return np.where(ns == _NaT, _open, ns) if open else ns
+
+
+# Sum of weight * (number of intervals covering each day) over the (weight,
+# starts, ends) sets of intervals, for each group of df's rows by by (a
+# column name, a Series or a list of them, as for groupby). Without by, a
+# Series of counts; otherwise a DataFrame with a column per group
+def _nightly(days, intervals, df: pd.DataFrame, by=None):
+    days = pd.DatetimeIndex(pd.to_datetime(days), name="day")
+    day_ns = _ns(days)
+    if by is None:
+        codes, groups = np.zeros(len(df), dtype="int64"), None
+    else:
+        grouper = df.groupby(by, sort=True, observed=True)
+        ngroup = grouper.ngroup().to_numpy(dtype="float64")
+        codes = np.where(np.isnan(ngroup), -1, ngroup).astype("int64")
+        groups = grouper.size().index
+    n_groups = 1 if groups is None else len(groups)
+    n_bins = len(days) + 1
+    deltas = np.zeros(n_groups * n_bins, dtype="int64")
+    for weight, starts, ends in intervals:
+        valid = (codes >= 0) & (starts != _NaT) & (starts < ends)
+        offsets = codes[valid] * n_bins
+        start_bins = offsets + np.searchsorted(day_ns, starts[valid], "left")
+        end_bins = offsets + np.searchsorted(day_ns, ends[valid], "left")
+        deltas += weight * (
+            np.bincount(start_bins, minlength=len(deltas))
+            - np.bincount(end_bins, minlength=len(deltas))
+        )
+    counts = deltas.reshape(n_groups, n_bins)[:, :-1].cumsum(axis=1)
+    if groups is None:
+        return pd.Series(counts[0], index=days)
+    return pd.DataFrame(counts.T, index=days, columns=groups)
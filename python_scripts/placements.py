@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+from . import helper
 
 sort_order = [
     "o_cli_id",
@@ -30,20 +32,25 @@ def get_placements(df_passed: pd.DataFrame, sort_order: str | list[str] or None
 def sort_values_and_add_cols(dffp: pd.DataFrame):
     # Re-sort the placements
     dffp = dffp.sort_values(sort_order)
+    return add_cols(dffp)
+
+
+# Add the derived columns to placements that are already sorted
+def add_cols(dffp: pd.DataFrame):
     # Add a duration field
     dffp["dur"] = dffp.pl_end_dt - dffp.pl_start_dt
     # Add number of moves (including within services)
     dffp["moves_all"] = dffp.groupby("o_cli_id")["o_cli_id"].transform("count") - 1
-    present_cols_for_prev = dffp.columns[dffp.columns.isin(cols_for_prev)]
-    # Create temporary shifted dataframe
-    dffp_prev_same_oclid = (
-        dffp[present_cols_for_prev]
-        .shift(1)
-        .where(dffp.o_cli_id == dffp.shift(1).o_cli_id)
-        .rename((lambda x: "prev_" + x), axis="columns")
-    )
-    # Combine the placement dataframe with the dataframe of previous placements
-    dffp = dffp.join(dffp_prev_same_oclid)
+    # The index label of the same person's previous placement, through which
+    # dffp.prev looks up the previous placement's columns when they're used
+    adj = Adjacency(dffp)
+    prev_row = adj.prev(pd.Series(dffp.index, index=dffp.index))
+    if pd.api.types.is_integer_dtype(dffp.index):
+        prev_row = prev_row.astype("Int64")
+    dffp["prev_row"] = prev_row
+    # Only the previous placement's columns used most are added as prev_*
+    for col in dffp.columns[dffp.columns.isin(prev_cols)]:
+        dffp[f"prev_{col}"] = adj.prev(dffp[col])
     # Add gap field, excluding cases where the previous row was for a different person
     dffp["gap"] = dffp.pl_start_dt - dffp.prev_pl_end_dt
     return dffp
@@ -61,7 +68,9 @@ def drop_added_cols(dffp: pd.DataFrame):
 
 def eliminate_overlaps(dffp: pd.DataFrame):
     # Un-backdate internal transfers
-    dffp_prev = dffp.shift(1)
+    dffp_prev = Adjacency(dffp).prev_frame(
+        dffp, ["o_cli_id", "pl_end_reason", "pl_end_dt"]
+    )
     rows_to_correct = (
         (dffp.o_cli_id == dffp_prev.o_cli_id)
         & (dffp_prev.pl_end_reason == "INTERNAL TRANSFER")
@@ -81,7 +90,9 @@ def eliminate_overlaps(dffp: pd.DataFrame):
     )
 
     # Unbackdate moves that were within the same service
-    dffp_prev = dffp.shift(1)  # Update previous
+    dffp_prev = Adjacency(dffp).prev_frame(
+        dffp, ["o_cli_id", "svc_id", "pl_end_dt"]
+    )  # Update previous
     rows_to_correct = (
         (dffp.o_cli_id == dffp_prev.o_cli_id)
         & (dffp_prev.svc_id == dffp.svc_id)
@@ -102,7 +113,7 @@ def eliminate_overlaps(dffp: pd.DataFrame):
     )
 
     # Eliminate remaining overlaps
-    dffp_next = dffp.shift(-1)
+    dffp_next = Adjacency(dffp).next_frame(dffp, ["o_cli_id", "gap", "pl_start_dt"])
     rows_to_correct = (dffp.o_cli_id == dffp_next.o_cli_id) & (
         dffp_next.gap.dt.days < 0
     )  # where the next placement has a negative gap
@@ -124,26 +135,28 @@ def eliminate_overlaps(dffp: pd.DataFrame):
     return dffp
 
 
+# Eliminate gaps between services using different thresholds (in days) depending
+# on the reason for leaving the previous placement.
+gap_thresholds = {
+    "Moved into Supported Housing (Planned)": 8,
+    "Moved within Supported Housing (Same Pathway)": 31,
+    "Other (Unplanned)": 1,
+    "Moved into HSR Accom _ Lower level (Planned)": 8,
+    "INTERNAL TRANSFER": 8,
+    "Other (Planned)": 1,
+    "Moved into HSR Accom _ High level (Planned)": 8,
+    "Moved within Supported Housing (Different Pathway)": 20,
+    "Moved into HSR Accom _ Same level (Planned)": 14,
+    "Moved to Substance Misuse Pathway (Planned)": 31,
+    "Moved into HSR Accom _ High level (Unplanned)": 31,
+    "(Pathway 4 Only) Moved to Level 1, 2 or 3 Supported Housing (Planned)": 31,
+    "Moved into HSR Accom _ Same level (Unplanned)": 31,
+    "(Pathway 4 Only) Moved to Level 4 Supported Housing (Planned)": 31,
+}
+
+
 def reduce_gaps(dffp: pd.DataFrame):
-    # Eliminate gaps between services using different thresholds depending on the
-    # reason for leaving the previous placement.
-    gap_comparison_dict = {
-        "Moved into Supported Housing (Planned)": 8,
-        "Moved within Supported Housing (Same Pathway)": 31,
-        "Other (Unplanned)": 1,
-        "Moved into HSR Accom _ Lower level (Planned)": 8,
-        "INTERNAL TRANSFER": 8,
-        "Other (Planned)": 1,
-        "Moved into HSR Accom _ High level (Planned)": 8,
-        "Moved within Supported Housing (Different Pathway)": 20,
-        "Moved into HSR Accom _ Same level (Planned)": 14,
-        "Moved to Substance Misuse Pathway (Planned)": 31,
-        "Moved into HSR Accom _ High level (Unplanned)": 31,
-        "(Pathway 4 Only) Moved to Level 1, 2 or 3 Supported Housing (Planned)": 31,
-        "Moved into HSR Accom _ Same level (Unplanned)": 31,
-        "(Pathway 4 Only) Moved to Level 4 Supported Housing (Planned)": 31,
-    }
-    gap_comparison_series = dffp.prev_pl_end_reason.map(gap_comparison_dict)
+    gap_comparison_series = dffp.prev_pl_end_reason.map(gap_thresholds)
     rows_to_correct = (
         (~gap_comparison_series.isna())
         & (dffp.gap.dt.days > 0)
@@ -160,6 +173,245 @@ def reduce_gaps(dffp: pd.DataFrame):
     return dffp
 
 
+##########################################################################
+# Correct placements: eliminate_overlaps then reduce_gaps as passes over
+# NumPy arrays of the few columns they use. The placements are re-sorted
+# (by their keys only) and neighbours recompared at the same points as
+# there. One pass can leave overlaps, e.g. in a chain of three or more
+# placements, so the passes are repeated for the people whose placements
+# changed until none do. The number of passes that changed each person's
+# placements is in correction__iterations. People whose placements are still
+# changing after max_iterations passes are logged. The full frame is only
+# reordered and has its added columns remade once, at the end
+##########################################################################
+def correct_placements(dffp: pd.DataFrame, max_iterations=100):
+    dffp = drop_added_cols(dffp)
+    person = pd.factorize(dffp.o_cli_id, sort=True)[0]
+    svc = pd.factorize(dffp.svc_id)[0]
+    # Dates as int64 nanoseconds (NaT is the minimum), copied to update
+    dts = dict(
+        (col, dffp[col].to_numpy(dtype="datetime64[ns]").view("int64").copy())
+        for col in set(sort_order + ["pl_start_dt", "pl_end_dt", "vac_filled_dt"])
+        - {"o_cli_id"}
+    )
+    start, end, filled = dts["pl_start_dt"], dts["pl_end_dt"], dts["vac_filled_dt"]
+    end_reason = dffp.pl_end_reason.astype(object)
+    internal_transfer = (end_reason == "INTERNAL TRANSFER").to_numpy(dtype=bool)
+    max_gap_days = end_reason.map(gap_thresholds).to_numpy(dtype="float64")
+
+    def sort(rows):
+        # Stable, with missing values last, as sort_values(sort_order)
+        keys = [
+            (
+                np.where(person < 0, len(person), person)
+                if col == "o_cli_id"
+                else np.where(dts[col] == _NaT, _NaT_last, dts[col])
+            )
+            for col in sort_order
+        ]
+        return rows[np.lexsort([key[rows] for key in reversed(keys)])]
+
+    def neighbours(rows, offset):
+        # The row offset rows along in the order (-1 if none) and whether it's
+        # the same person's
+        other = np.full(len(person), -1)
+        if offset > 0:
+            other[rows[:-offset]] = rows[offset:]
+        else:
+            other[rows[-offset:]] = rows[:offset]
+        return other, (other >= 0) & (person >= 0) & (person[other] == person)
+
+    def gaps(prev, same):
+        # Gap after each row's previous placement; is_gap is False for NaT
+        is_gap = same & (start != _NaT) & (end[prev] != _NaT)
+        return np.where(is_gap, start - end[prev], 0), is_gap
+
+    def start_at_prev_end(rows_to_correct, prev):
+        start[rows_to_correct] = end[prev[rows_to_correct]]
+        filled[rows_to_correct] = end[prev[rows_to_correct]]
+
+    # One pass over some people's placements, sorted: returns them re-sorted,
+    # and which rows were unbackdated, had an overlap removed or a gap removed
+    def correction_pass(rows):
+        prev, same = neighbours(rows, -1)
+        gap, is_gap = gaps(prev, same)
+        # Un-backdate internal transfers
+        unbackdated = same & internal_transfer[prev] & is_gap & (gap < 0)
+        start_at_prev_end(unbackdated, prev)
+        rows = sort(rows)
+        # Update gap (against the previous placement before re-sorting)
+        new_gap, new_is_gap = gaps(prev, same)
+        gap, is_gap = np.where(same, new_gap, gap), np.where(same, new_is_gap, is_gap)
+        # Unbackdate moves that were within the same service
+        prev, same = neighbours(rows, -1)
+        same_svc = (svc >= 0) & (svc[prev] == svc)
+        rows_to_correct = same & same_svc & is_gap & (gap < 0)
+        start_at_prev_end(rows_to_correct, prev)
+        unbackdated |= rows_to_correct
+        rows = sort(rows)
+        new_gap, new_is_gap = gaps(prev, same)
+        gap, is_gap = np.where(same, new_gap, gap), np.where(same, new_is_gap, is_gap)
+        # Eliminate remaining overlaps by making the older placement end when
+        # the newer one starts
+        next_row, same_next = neighbours(rows, 1)
+        overlap_removed = same_next & is_gap[next_row] & (gap[next_row] < 0)
+        end[overlap_removed] = start[next_row[overlap_removed]]
+        rows = sort(rows)
+        # Reduce gaps, as reduce_gaps
+        prev, same = neighbours(rows, -1)
+        gap, is_gap = gaps(prev, same)
+        gap_days = np.floor_divide(gap, _day)
+        max_gap = np.where(same, max_gap_days[prev], np.nan)
+        gap_removed = is_gap & (gap_days > 0) & (gap_days <= max_gap)
+        start_at_prev_end(gap_removed, prev)
+        return sort(rows), unbackdated, overlap_removed, gap_removed
+
+    rows = sort(np.arange(len(dffp)))
+    unbackdated = np.zeros(len(dffp), dtype=bool)
+    overlap_removed = np.zeros(len(dffp), dtype=bool)
+    gap_removed = np.zeros(len(dffp), dtype=bool)
+    iterations = np.zeros(len(dffp), dtype="int64")
+    # Rows of the people whose placements are still changing. A person's rows
+    # are together in the order, so re-sorting theirs leaves the others in
+    # place. People still changing after max_iterations are left as they are
+    changing = np.ones(len(dffp), dtype=bool)
+    for _ in range(max_iterations):
+        rows_changing = changing[rows]
+        rows[rows_changing], *corrected = correction_pass(rows[rows_changing])
+        unbackdated |= corrected[0]
+        overlap_removed |= corrected[1]
+        gap_removed |= corrected[2]
+        changing = np.isin(person, person[corrected[0] | corrected[1] | corrected[2]])
+        if not changing.any():
+            break
+        iterations[changing] += 1
+    else:
+        helper.log(
+            f"Placements of {len(np.unique(person[changing])):,} people were still"
+            f" changing after {max_iterations} correction passes, so may not be"
+            " fully corrected"
+        )
+
+    def as_dts(values):
+        return values.view("datetime64[ns]")
+
+    dffp = dffp.assign(
+        pl_start_dt=as_dts(start),
+        vac_filled_dt=as_dts(filled),
+        pl_end_dt=as_dts(end),
+        moved_out_dt=as_dts(end),
+        correction__unbackdated=pd.array(unbackdated, dtype="boolean"),
+        correction__overlap_removed=pd.array(overlap_removed, dtype="boolean"),
+        correction__gap_removed=gap_removed,
+        correction__iterations=iterations,
+    )
+    return add_cols(dffp.iloc[rows])
+
+
+_NaT = np.iinfo("int64").min
+_NaT_last = np.iinfo("int64").max
+_day = pd.Timedelta(days=1).value
+
+
+##########################################################################
+# Adjacency of sorted placements: the positions of each row's previous and
+# next rows for the same person (-1 if none), and where each person's and
+# each route's rows start and end (as slices). Made once per stage from the
+# frame as it's sorted then, and passed to the functions that use it, instead
+# of shifting the whole frame. It's only valid until the frame is re-sorted
+# or filtered, or its o_cli_id or route_id change
+##########################################################################
+class Adjacency:
+    def __init__(self, dffp: pd.DataFrame):
+        person = pd.factorize(dffp["o_cli_id"])[0]
+        self.person_starts, self.person_ends = _runs(person)
+        if "route_id" in dffp:
+            route = pd.factorize(dffp["route_id"])[0]
+            self.route_starts, self.route_ends = _runs(route)
+        positions = np.arange(len(dffp), dtype="int32")
+        first, last = np.ones(len(dffp), dtype=bool), np.ones(len(dffp), dtype=bool)
+        first[1:] = (person[1:] < 0) | (person[1:] != person[:-1])
+        last[:-1] = first[1:]
+        self.prev_pos = np.where(first, -1, positions - 1).astype("int32")
+        self.next_pos = np.where(last, -1, positions + 1).astype("int32")
+
+    # Each row's value of col in the same person's previous (next) row, or
+    # missing if there isn't one, as col.shift(1) (col.shift(-1)) would be
+    def prev(self, col: pd.Series):
+        return _take(col, self.prev_pos)
+
+    def next(self, col: pd.Series):
+        return _take(col, self.next_pos)
+
+    def prev_frame(self, dffp: pd.DataFrame, cols: list[str]):
+        return pd.DataFrame(dict((col, self.prev(dffp[col])) for col in cols))
+
+    def next_frame(self, dffp: pd.DataFrame, cols: list[str]):
+        return pd.DataFrame(dict((col, self.next(dffp[col])) for col in cols))
+
+
+# The start and end (exclusive) of each run of equal codes, where missing
+# values (-1) are each in a run of their own
+def _runs(codes: np.ndarray):
+    starts = np.flatnonzero(
+        np.concatenate([[True], (codes[1:] < 0) | (codes[1:] != codes[:-1])])
+        if len(codes)
+        else []
+    ).astype("int32")
+    ends = np.append(starts[1:], len(codes)).astype("int32")
+    return starts, ends
+
+
+# The values of col at positions (missing at -1), with col's index
+def _take(col: pd.Series, positions: np.ndarray):
+    return col.reset_index(drop=True).reindex(positions).set_axis(col.index)
+
+
+# Columns of the same person's previous placement added as prev_* columns:
+# the others in cols_for_prev are read through dffp.prev
+prev_cols = [
+    "pl_end_dt",
+    "pl_end_reason",
+    "svc_id",
+    "pathway_level",
+]
+
+
+# Read the same person's previous placement's columns, e.g. dffp.prev["vac_id"]
+# as prev_vac_id was. Previous placements filtered out of df read as missing
+@pd.api.extensions.register_dataframe_accessor("prev")
+class PrevAccessor:
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+
+    def __getitem__(self, col: str):
+        if f"prev_{col}" in self._df.columns:
+            return self._df[f"prev_{col}"]
+        if col not in cols_for_prev:
+            raise KeyError(col)
+        positions = _first_positions(self._df.index, self._df.prev_row)
+        return _take(self._df[col], positions).rename(f"prev_{col}")
+
+    def to_frame(self, cols=None):
+        if cols is None:
+            cols = [col for col in self._df.columns if col in cols_for_prev]
+        return pd.DataFrame(dict((f"prev_{col}", self[col]) for col in cols))
+
+
+# The position of the first row with each of labels (-1 if there isn't one).
+# A frame can repeat a placement's label, e.g. a placement in several of
+# helper.get_snapshots' snapshots, and each of its rows has the same values
+def _first_positions(index: pd.Index, labels):
+    if index.is_unique:
+        return index.get_indexer(labels)
+    codes, uniques = pd.factorize(index)
+    first = np.full(len(uniques), -1)
+    rows = np.flatnonzero(codes >= 0)[::-1]
+    first[codes[rows]] = rows
+    found = uniques.get_indexer(labels)
+    return np.where(found < 0, -1, first[found])
+
+
 cols_for_prev = [
     "o_cli_id",
     "vac_id",
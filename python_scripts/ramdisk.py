@@ -4,12 +4,17 @@ import subprocess
 import re
 from pathlib import Path
 import pickle
+import json
+import hashlib
 import os
-from collections import namedtuple
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
 
 _default_ramdisk_dir = "/mnt/ramdisk/"
 _default_ramdisk_mount_cmd = "sudo /bin/mount -t tmpfs tmpfs -o size=200M,noswap,uid=1000,gid=1000,mode=0700 /mnt/ramdisk"
-_df_filename = "df_dict.p"
+_manifest_filename = "manifest.json"
+_manifest_version = 1
 
 
 def mount_drive_if_needed(
@@ -24,26 +29,302 @@ def mount_drive_if_needed(
         helper.log(f"Mounted {ramdisk_dir}", verbose=verbose)
 
 
-def save_df(df: namedtuple, ramdisk_dir: str = _default_ramdisk_dir):
-    df_dict_path = Path(ramdisk_dir) / _df_filename
+def save_df(
+    df: "combined.Struct",
+    ramdisk_dir: str = _default_ramdisk_dir,
+    sources: dict | None = None,
+    base_dfs: list[str] | None = None,
+):
     df_dict = df._asdict()
-    df_to_save = dict((k, df_dict[k]) for k in combined._dfs_to_save_to_ramdisk)
-    oldmask = os.umask(0o077)
-    pickle.dump(df_to_save, open(df_dict_path, "wb"))
-    os.umask(oldmask)
+    if base_dfs is None:
+        base_dfs = combined._dfs_to_save_to_ramdisk
+    df_to_save = dict((k, df_dict[k]) for k in base_dfs)
+    save_frames(
+        df_to_save,
+        ramdisk_dir=ramdisk_dir,
+        manifest_updates=None if sources is None else {"sources": sources},
+    )
+    save_derived_frames(df_dict, ramdisk_dir=ramdisk_dir)
 
 
-def load_df(ramdisk_dir: str = _default_ramdisk_dir):
-    df_dict_path = Path(ramdisk_dir) / _df_filename
-    df_dict = pickle.load(open(df_dict_path, "rb"))
-    df_dict = combined._get_combined_dfs(df_dict)
-    df = namedtuple("Struct", df_dict)(**df_dict)
+# tr_a_columns: the tr_a columns to load, into tr_a and the frames combined
+# from it (None loads them all). Only those columns are read from the cache.
+def load_df(
+    ramdisk_dir: str = _default_ramdisk_dir,
+    verbose: bool = False,
+    tr_a_columns: list[str] | None = None,
+):
+    manifest = read_manifest(ramdisk_dir)
+    if derived_frames_current(manifest, ramdisk_dir):
+        helper.log("Loading derived dataframes from RAM disk.", verbose=verbose)
+        cols_to_drop = combined._tr_a_columns_to_drop(
+            manifest["frames"]["tr_a"]["columns"], tr_a_columns
+        )
+        df_dict = load_frames(
+            combined._dfs_to_save_to_ramdisk + combined._derived_dfs,
+            columns=dict(
+                (
+                    k,
+                    [
+                        c
+                        for c in manifest["frames"][k]["columns"]
+                        if c not in cols_to_drop
+                    ],
+                )
+                for k in ["tr_a"] + combined._derived_dfs
+            ),
+            ramdisk_dir=ramdisk_dir,
+        )
+    else:
+        helper.log("Derived dataframes out of date; recombining.", verbose=verbose)
+        df_dict = load_frames(combined._dfs_to_save_to_ramdisk, ramdisk_dir=ramdisk_dir)
+        # Combine all the columns, so the saved derived frames are complete
+        df_dict = combined._get_combined_dfs(df_dict)
+        save_derived_frames(df_dict, ramdisk_dir=ramdisk_dir)
+        df_dict = combined.project_tr_a(df_dict, tr_a_columns)
+    df = combined.Struct(**df_dict)
     return df
 
 
 def files_exist(ramdisk_dir: str = _default_ramdisk_dir):
-    df_dict_path = Path(ramdisk_dir) / _df_filename
-    return df_dict_path.exists() and df_dict_path.is_file()
+    manifest = read_manifest(ramdisk_dir)
+    return all(
+        k in manifest["frames"]
+        and (Path(ramdisk_dir) / manifest["frames"][k]["file"]).is_file()
+        for k in combined._dfs_to_save_to_ramdisk
+    )
+
+
+#####################################################################
+# Columnar cache: one Arrow IPC (Feather v2) file per dataframe, plus
+# a manifest recording what's stored and how to restore exact dtypes
+#####################################################################
+def read_manifest(ramdisk_dir: str = _default_ramdisk_dir):
+    manifest_path = Path(ramdisk_dir) / _manifest_filename
+    if manifest_path.is_file():
+        manifest = json.loads(manifest_path.read_text())
+        if manifest.get("version") == _manifest_version:
+            return manifest
+    return {"version": _manifest_version, "frames": {}}
+
+
+def write_manifest(manifest: dict, ramdisk_dir: str = _default_ramdisk_dir):
+    manifest_path = Path(ramdisk_dir) / _manifest_filename
+    oldmask = os.umask(0o077)
+    # Write then rename, so a reader never sees a half-written manifest
+    tmp_path = manifest_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=1))
+    tmp_path.replace(manifest_path)
+    os.umask(oldmask)
+
+
+def save_frames(
+    frames: dict,
+    ramdisk_dir: str = _default_ramdisk_dir,
+    compression: str = "uncompressed",
+    manifest_updates: dict | None = None,
+):
+    manifest = read_manifest(ramdisk_dir)
+    oldmask = os.umask(0o077)
+    for name, frame in frames.items():
+        manifest["frames"][name] = _write_frame(name, frame, ramdisk_dir, compression)
+    os.umask(oldmask)
+    if manifest_updates is not None:
+        manifest.update(manifest_updates)
+    # The manifest is written last, so frames are only used once fully saved
+    write_manifest(manifest, ramdisk_dir)
+
+
+#########################################################################
+# Source file fingerprints (size, mtime and content hash), used to find
+# which datasets need reloading from CSV. Files whose size and mtime are
+# unchanged keep their previous hash, so they aren't read again.
+#########################################################################
+def source_fingerprints(basePath: str, manifest: dict):
+    previous = manifest.get("sources", {})
+    fingerprints = {}
+    for dataset in combined._dataset_dfs:
+        fingerprints[dataset] = {}
+        for path in combined._dataset_source_paths(dataset, basePath):
+            stat = path.stat()
+            fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+            prev = previous.get(dataset, {}).get(str(path))
+            if (
+                prev is not None
+                and prev["size"] == fingerprint["size"]
+                and prev["mtime"] == fingerprint["mtime"]
+            ):
+                fingerprint["sha256"] = prev["sha256"]
+            else:
+                fingerprint["sha256"] = _file_hash(path)
+            fingerprints[dataset][str(path)] = fingerprint
+    return fingerprints
+
+
+def changed_datasets(fingerprints: dict, manifest: dict):
+    # Compare content hashes only, so a file that's been touched but not
+    # changed doesn't trigger a reload
+    previous = manifest.get("sources", {})
+    return [
+        dataset
+        for dataset, files in fingerprints.items()
+        if dict((f, fp["sha256"]) for f, fp in files.items())
+        != dict((f, fp["sha256"]) for f, fp in previous.get(dataset, {}).items())
+    ]
+
+
+##########################################################################
+# Derived dataframes (the merged and corrected placement data) are cached
+# under a key made from the base dataframes' contents and the code that
+# derives them, so they're rebuilt automatically when either changes
+##########################################################################
+def derived_frames_key(manifest: dict):
+    key = hashlib.sha256()
+    for name in combined._dfs_to_save_to_ramdisk:
+        key.update(name.encode("utf8"))
+        key.update(manifest["frames"][name]["sha256"].encode("utf8"))
+    for module in combined._derivation_modules:
+        key.update(Path(module.__file__).read_bytes())
+    return key.hexdigest()
+
+
+def derived_frames_current(manifest: dict, ramdisk_dir: str = _default_ramdisk_dir):
+    return (
+        "derived_key" in manifest
+        and all(k in manifest["frames"] for k in combined._derived_dfs)
+        and all(
+            (Path(ramdisk_dir) / manifest["frames"][k]["file"]).is_file()
+            for k in combined._derived_dfs
+        )
+        and manifest["derived_key"] == derived_frames_key(manifest)
+    )
+
+
+def save_derived_frames(df_dict: dict, ramdisk_dir: str = _default_ramdisk_dir):
+    key = derived_frames_key(read_manifest(ramdisk_dir))
+    # Derived frames are wide and always read whole, so compress them to
+    # leave room on the RAM disk
+    save_frames(
+        dict((k, df_dict[k]) for k in combined._derived_dfs),
+        ramdisk_dir=ramdisk_dir,
+        compression="lz4",
+        manifest_updates={"derived_key": key},
+    )
+
+
+def load_frames(
+    names: list[str] | None = None,
+    columns: dict | None = None,
+    ramdisk_dir: str = _default_ramdisk_dir,
+):
+    manifest = read_manifest(ramdisk_dir)
+    if names is None:
+        names = list(manifest["frames"])
+    if columns is None:
+        columns = {}
+    return dict(
+        (name, _read_frame(manifest, name, columns.get(name), ramdisk_dir))
+        for name in names
+    )
+
+
+def load_frame(
+    name: str,
+    columns: list[str] | None = None,
+    ramdisk_dir: str = _default_ramdisk_dir,
+):
+    return _read_frame(read_manifest(ramdisk_dir), name, columns, ramdisk_dir)
+
+
+def _write_frame(name: str, frame: pd.DataFrame, ramdisk_dir: str, compression: str):
+    entry = {
+        "rows": len(frame),
+        "columns": frame.columns.tolist(),
+        "index_dtype": str(frame.index.dtype),
+        # Arrow dictionaries come back with object categories, so record
+        # the categoricals that need their categories' dtype restoring
+        "category_dtypes": dict(
+            (c, str(frame[c].cat.categories.dtype))
+            for c in frame.columns
+            if isinstance(frame[c].dtype, pd.CategoricalDtype)
+            and frame[c].cat.categories.dtype != object
+        ),
+        # Arrow reads nulls in object columns as None, so record which
+        # null value each object column originally used
+        "object_nulls": dict(
+            (c, _null_name(frame[c]))
+            for c in frame.columns
+            if frame[c].dtype == object and _null_name(frame[c]) is not None
+        ),
+    }
+    try:
+        table = pa.Table.from_pandas(frame)
+        entry["file"] = f"{name}.arrow"
+        entry["format"] = "arrow"
+        feather.write_feather(
+            table, Path(ramdisk_dir) / entry["file"], compression=compression
+        )
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Columns with mixed Python objects can't be stored as Arrow
+        entry["file"] = f"{name}.p"
+        entry["format"] = "pickle"
+        pickle.dump(frame, open(Path(ramdisk_dir) / entry["file"], "wb"))
+    entry["sha256"] = _file_hash(Path(ramdisk_dir) / entry["file"])
+    return entry
+
+
+def _file_hash(path: Path):
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _read_frame(manifest: dict, name: str, columns: list[str] | None, ramdisk_dir: str):
+    entry = manifest["frames"][name]
+    path = Path(ramdisk_dir) / entry["file"]
+    if entry["format"] == "pickle":
+        frame = pickle.load(open(path, "rb"))
+        return frame if columns is None else frame[columns]
+    if columns is not None:
+        # Stored index columns must be read too, or the index is lost
+        with pa.memory_map(str(path)) as source:
+            schema = pa.ipc.open_file(source).schema
+        index_cols = [
+            c for c in schema.pandas_metadata["index_columns"] if isinstance(c, str)
+        ]
+        columns = list(columns) + index_cols
+    # Memory-mapped, so only the buffers of the columns read are touched in an
+    # uncompressed file (compressed ones are decompressed). to_pandas still
+    # copies the columns into the frame
+    frame = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    if str(frame.index.dtype) != entry["index_dtype"]:
+        frame.index = frame.index.astype(entry["index_dtype"])
+    for c, dtype in entry["category_dtypes"].items():
+        if c in frame.columns:
+            frame[c] = frame[c].cat.rename_categories(
+                frame[c].cat.categories.astype(dtype)
+            )
+    for c, null_name in entry["object_nulls"].items():
+        if c in frame.columns:
+            frame[c] = frame[c].where(frame[c].notna(), _nulls[null_name])
+    return frame
+
+
+_nulls = {"nan": float("nan"), "NA": pd.NA, "NaT": pd.NaT}
+
+
+def _null_name(col: pd.Series):
+    # Columns mixing null values (e.g. after an outer merge) use the first one
+    nulls = col[col.isna()]
+    if nulls.empty or nulls.iloc[0] is None:
+        return None
+    elif nulls.iloc[0] is pd.NA:
+        return "NA"
+    elif nulls.iloc[0] is pd.NaT:
+        return "NaT"
+    return "nan"
 
 
 def is_mounted(ramdisk_dir: str = _default_ramdisk_dir):
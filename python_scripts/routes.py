@@ -1,4 +1,7 @@
+import numpy as np
 import pandas as pd
+from types import MappingProxyType
+from . import placements
 
 
 def add_routes(dffp: pd.DataFrame):
@@ -14,6 +17,37 @@ def add_routes(dffp: pd.DataFrame):
     return dffp
 
 
+##########################################################################
+# Route table: one row per route (indexed by route_id), from placements with
+# route_ids as add_routes leaves them. first_row and last_row are the index
+# labels of the route's first and last placements, e.g. for
+# dffp.loc[rt.last_row]. Made from the routes' start and end positions in
+# one pass, without regrouping the placements. adj is dffp's adjacency, if
+# it's already been made
+##########################################################################
+def get_routes(dffp: pd.DataFrame, adj: placements.Adjacency | None = None):
+    if adj is None:
+        adj = placements.Adjacency(dffp)
+    firsts = dffp.iloc[adj.route_starts]
+    lasts = dffp.iloc[adj.route_ends - 1]
+    return pd.DataFrame(
+        {
+            "o_cli_id": firsts.o_cli_id.array,
+            "first_row": firsts.index,
+            "last_row": lasts.index,
+            "rt_start_dt": firsts.pl_start_dt.array,
+            "rt_end_dt": lasts.pl_end_dt.array,
+            "n_pls": adj.route_ends - adj.route_starts,
+            "rt_end_reason": lasts.pl_end_reason.array,
+            "rt_end_cat": get_end_cats(lasts.pl_end_reason).array,
+            "rt_end_planned": get_is_planned(lasts.pl_end_reason).array,
+            "first_svc_id": firsts.svc_id.array,
+            "last_svc_id": lasts.svc_id.array,
+        },
+        index=pd.Index(firsts.route_id, name="route_id"),
+    )
+
+
 end_reasons_map = {
     # { pl_end_reason: { (rt_end_cat, is_planned) } }
     "Abandoned (Unplanned)": ("Abandoned", "Unplanned"),
@@ -280,11 +314,69 @@ def grouped_cats_to_map(grouped_cats):
     return map
 
 
+# The two tables must list the same reasons in the same categories
+if grouped_cats_to_map(grouped_cats) != end_reasons_map:
+    raise ValueError("end_reasons_map and grouped_cats don't agree")
+
+
+# Read-only views of the maps, which are shared with the lookups below
 def get_end_cats_map():
-    cats_map = {k: v for k, (v, _) in end_reasons_map.items()}
-    return cats_map
+    return MappingProxyType(_end_cats_map)
 
 
 def get_is_planned_map():
-    planned_map = {k: v for k, (_, v) in end_reasons_map.items()}
-    return planned_map
+    return MappingProxyType(_is_planned_map)
+
+
+_end_cats_map = {k: v for k, (v, _) in end_reasons_map.items()}
+_is_planned_map = {k: v for k, (_, v) in end_reasons_map.items()}
+
+
+##############################################################################
+# End reasons as codes: each reason's position in end_reasons_map, with a
+# lookup array per column giving the code of its rt_end_cat or is_planned
+# category. A column of end reasons is matched to the reasons once per
+# distinct value (its categories, if it's categorical) and then looked up with
+# a single take over its codes. Reasons that aren't in end_reasons_map, and
+# missing values, look up as missing
+##############################################################################
+end_reasons = pd.Index(list(end_reasons_map), name="pl_end_reason")
+end_cat_dtype = pd.CategoricalDtype(list(grouped_cats))
+is_planned_dtype = pd.CategoricalDtype(["Planned", "Unplanned", "Unknown"])
+# Lookup arrays, with a trailing -1 (missing) for code -1
+_end_cat_codes = np.append(
+    end_cat_dtype.categories.get_indexer([v for v, _ in end_reasons_map.values()]),
+    -1,
+).astype("int8")
+_is_planned_codes = np.append(
+    is_planned_dtype.categories.get_indexer([v for _, v in end_reasons_map.values()]),
+    -1,
+).astype("int8")
+if (_end_cat_codes[:-1] < 0).any() or (_is_planned_codes[:-1] < 0).any():
+    raise ValueError("end_reasons_map has an unknown rt_end_cat or is_planned value")
+
+
+def end_reason_codes(end_reason: pd.Series):
+    if isinstance(end_reason.dtype, pd.CategoricalDtype):
+        codes, uniques = end_reason.cat.codes.to_numpy(), end_reason.cat.categories
+    else:
+        codes, uniques = pd.factorize(end_reason)
+    return np.append(end_reasons.get_indexer(uniques), -1)[codes]
+
+
+def _lookup_end_reasons(end_reason: pd.Series, lookup: np.ndarray, dtype):
+    return pd.Series(
+        pd.Categorical.from_codes(lookup[end_reason_codes(end_reason)], dtype=dtype),
+        index=end_reason.index,
+        name=end_reason.name,
+    )
+
+
+# rt_end_cat of each end reason, as a categorical
+def get_end_cats(end_reason: pd.Series):
+    return _lookup_end_reasons(end_reason, _end_cat_codes, end_cat_dtype)
+
+
+# is_planned of each end reason, as a categorical
+def get_is_planned(end_reason: pd.Series):
+    return _lookup_end_reasons(end_reason, _is_planned_codes, is_planned_dtype)
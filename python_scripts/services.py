@@ -1,5 +1,6 @@
 import pandas as pd
-from . import helper, setup
+from . import cleaning, helper, setup
+from enum import IntFlag
 from pathlib import Path
 
 pd.options.mode.copy_on_write = True
@@ -22,16 +23,18 @@ def _get_services_real(basePath="./Original-CSVs", verbose=True, do_cleaning=Tru
         print("Loading Services.csv...")
     df_svc = pd.read_csv(dir / "Services.csv", dtype=df_svc_dtypes)
     # Short column names
-    df_svc = helper.short_cols(df_svc)
+    df_svc = cleaning.short_cols(df_svc)
     df_svc = df_svc.rename(columns={"svc_capacity_categorised": "svc_capacity"})
     if do_cleaning:
         # Clean the data
         df_svc = clean_services(df_svc)
     # Remap service types and pathway levels for OABs
     df_svc = remap_OABs(df_svc, basePath, verbose)
+    # Codes and flags for the (remapped) service types
+    df_svc = add_svc_type_codes(df_svc)
     # Short service type categories
     df_svc["svc_type_short"] = short_svc_types(df_svc["svc_type"])
-    df_svc["svc_type_short_padded"] = helper.col_padded(df_svc["svc_type_short"])
+    df_svc["svc_type_short_padded"] = cleaning.col_padded(df_svc["svc_type_short"])
     # Add data about levels under pre-distinct Pathways and post-distinct Pathways models
     df_svc = add_apwlvl(df_svc)
     return df_svc
@@ -84,7 +87,7 @@ def remap_OABs(df_svc: pd.DataFrame, basePath="./Original-CSVs", verbose=True):
     filename = "OAB_service_type_updates.csv"
     helper.log(f"Loading {filename}...", verbose=verbose)
     df_oabmaps = pd.read_csv(dir / filename, dtype=df_oabmaps_dtypes)
-    df_oabmaps = helper.short_cols(df_oabmaps)
+    df_oabmaps = cleaning.short_cols(df_oabmaps)
 
     # Remap service types for services using replcements from the updates data
     df_oabmaps = df_oabmaps.set_index("svc_id")
@@ -150,6 +153,13 @@ def short_svc_types(svc_type: pd.Series):
     )
 
 
+######################################################
+# Source files: a change to any of these means this
+# dataset has to be reloaded from CSV
+######################################################
+source_files = ["Services.csv", "OAB_service_type_updates.csv"]
+
+
 #########################
 # Data types for fields
 #########################
@@ -272,3 +282,82 @@ distinct_pathways_accom_svc_types = [
     # 'SSTS - Floating Support',
     # 'Non-pathway accommodation (temporary housing in empty buildings)'
 ]
+
+
+#####################################################################
+# Service type registry: a stable integer code for each service type,
+# and flags for which of the lists above it's in, stored on svc when
+# it's loaded so membership tests are bitwise ops on small integers
+#####################################################################
+class SvcTypeFlag(IntFlag):
+    ACCOM = 1
+    ADULT_PATHWAYS = 2
+    DISTINCT_PATHWAYS = 4
+
+
+svc_type_flag_lists = {
+    SvcTypeFlag.ACCOM: accom_svc_types,
+    SvcTypeFlag.ADULT_PATHWAYS: adult_pathways_accom_svc_types,
+    SvcTypeFlag.DISTINCT_PATHWAYS: distinct_pathways_accom_svc_types,
+}
+# A service type's code is its position here: only ever add new types at the
+# end, so that codes cached or saved elsewhere keep their meaning
+svc_types = [
+    "Accommodation Based - External Support Accom (ESA)",
+    "Accommodation Based - Family",
+    "Accommodation Based - Female Only Pathway",
+    "Accommodation Based - Long Stay",
+    "Accommodation Based - Male Only Pathway",
+    "Accommodation Based - Mixed Pathway",
+    "Accommodation Based - Outreach Access Beds (OAB)",
+    "Accommodation Based - Parent & Baby and Specialist Young People",
+    "Accommodation Based - Singles and couple non pathway",
+    "Accommodation Based - Specialist Adult Services - Non-Pathway",
+    "Accommodation Based - Substance Misuse Pathway",
+    "Accommodation Based - Supported Move-on",
+    "Accommodation Based - Young People Pathway",
+    "Accommodation Based-Emergency-Level One",
+    "Accommodation Based-High Support-Level Two",
+    "Accommodation Based-Medium Support-Level Three",
+    "Accommodation based - D&A - Abstinent",
+    "Assessment - HSR - Administration Only",
+    "Enhanced Access services - ISAT use only",
+    "Floating Support",
+    "Floating Support - Drug and Alcohol Service",
+    "Floating Support - Family Hostels",
+    "Floating Support - MH Complex",
+    "Floating Support - MH Crisis",
+    "Floating Support - MH Standard",
+    "Floating Support - Short Term - Resettlement",
+    "Rough Sleepers Initiative (RSI) Services",
+    "SSTS   Accommodation Based",
+    "SSTS - Floating Support",
+    "Non-pathway accommodation (temporary housing in empty buildings)",
+]
+svc_type_codes = dict((svc_type, code) for code, svc_type in enumerate(svc_types))
+svc_type_flags = dict(
+    (
+        svc_type,
+        sum(flag for flag, types in svc_type_flag_lists.items() if svc_type in types),
+    )
+    for svc_type in svc_types
+)
+_unregistered = [
+    t for types in svc_type_flag_lists.values() for t in types if t not in svc_types
+]
+if _unregistered:
+    raise ValueError(f"Service types missing from svc_types: {_unregistered}")
+
+
+# Add the code and flags of each service's type (<NA> for unregistered types)
+def add_svc_type_codes(df_svc: pd.DataFrame):
+    df_svc["svc_type_code"] = df_svc.svc_type.map(svc_type_codes).astype("Int8")
+    df_svc["svc_type_flags"] = df_svc.svc_type.map(svc_type_flags).astype("Int8")
+    return df_svc
+
+
+# Whether each row of df is at a service whose type has any of flags, e.g.
+# has_svc_type_flag(dffp, SvcTypeFlag.ADULT_PATHWAYS)
+def has_svc_type_flag(df: pd.DataFrame, flags: SvcTypeFlag):
+    type_flags = df.svc_type_flags.to_numpy(dtype="int8", na_value=0)
+    return pd.Series((type_flags & flags) != 0, index=df.index)
@@ -32,8 +32,14 @@ def eliminate_overlaps(*args, **kwargs):
     return placements.eliminate_overlaps(*args, **kwargs)
 
 
-def get_df_dffp(basepath: str, do_cleaning=True):
-    df = combined._get_dataframes_real(basepath, do_cleaning)
+def correct_placements(*args, **kwargs):
+    return placements.correct_placements(*args, **kwargs)
+
+
+def get_df_dffp(basepath: str, do_cleaning=True, parallel=False):
+    df = combined._get_dataframes_real(
+        basepath, do_cleaning=do_cleaning, parallel=parallel
+    )
 
     # Placements is based on filtered combined dataframe
     dffp = df.f_placements_corrected
@@ -41,6 +47,61 @@ def get_df_dffp(basepath: str, do_cleaning=True):
     return df, dffp
 
 
+#################################################################
+# Reload only the datasets whose source files (or the code that
+# loads them) have changed since they were saved to the RAM disk.
+# With reload=True every dataset is reloaded, and every source
+# file is hashed afresh rather than trusting the manifest
+#################################################################
+def get_df_dffp_incremental(
+    basepath: str,
+    ramdisk_dir: str = "/mnt/ramdisk/",
+    verbose=True,
+    parallel=False,
+    tr_a_columns: list[str] | None = None,
+    reload=False,
+):
+    manifest = ramdisk.read_manifest(ramdisk_dir)
+    helper.log("Checking source files for changes...", verbose=verbose)
+    fingerprints = ramdisk.source_fingerprints(basepath, {} if reload else manifest)
+    changed = ramdisk.changed_datasets(fingerprints, manifest)
+    if ramdisk.files_exist(ramdisk_dir) and not reload:
+        if not changed:
+            helper.log("No source files have changed.", verbose=verbose)
+            ramdisk.save_frames(
+                {}, ramdisk_dir, manifest_updates={"sources": fingerprints}
+            )
+            df = ramdisk.load_df(
+                ramdisk_dir, verbose=verbose, tr_a_columns=tr_a_columns
+            )
+            return df, df.f_placements_corrected
+        helper.log("Changed:", ", ".join(changed), verbose=verbose)
+        unchanged_dfs = ramdisk.load_frames(
+            [
+                k
+                for dataset, dfs in combined._dataset_dfs.items()
+                if dataset not in changed
+                for k in dfs
+            ],
+            ramdisk_dir=ramdisk_dir,
+        )
+        base_dfs = [k for dataset in changed for k in combined._dataset_dfs[dataset]]
+    else:
+        unchanged_dfs = None
+        base_dfs = None
+    helper.log("Loading from CSV...", verbose=verbose)
+    df = combined._get_dataframes_real(
+        basepath, verbose=verbose, unchanged_dfs=unchanged_dfs, parallel=parallel
+    )
+    ramdisk.save_df(
+        df, ramdisk_dir=ramdisk_dir, sources=fingerprints, base_dfs=base_dfs
+    )
+    if tr_a_columns is not None:
+        df_dict = combined.project_tr_a(df._asdict(), tr_a_columns)
+        df = combined.Struct(**df_dict)
+    return df, df.f_placements_corrected
+
+
 def get_dffp_uncorrected(df: pd.DataFrame):
     return get_placements(df.f_placements)
 
@@ -48,27 +109,36 @@ def get_dffp_uncorrected(df: pd.DataFrame):
 #################################################################
 # Load objects from RAM disk, if they've been saved, otherwise
 # generate them from the CSV files and then save save them to
-# the RAM disk so loading is near-instantaneous for other loads
+# the RAM disk so loading is near-instantaneous for other loads.
+# refresh=True reloads only the datasets whose source files have
+# changed since they were saved, and loads the rest from the RAM
+# disk. reload=True reloads every dataset from the CSV files.
+# tr_a_columns limits the Trusted Assessment columns loaded into
+# tr_a and the frames combined from it (None loads them all).
 #################################################################
 def setup(
     ramdisk_dir: str = "/mnt/ramdisk/",
     basepath: str = "/mnt/x/Original-CSVs/",
     reload=False,
     verbose=True,
+    parallel=False,
+    tr_a_columns: list[str] | None = None,
+    refresh=False,
 ):
     if (
         ramdisk.is_mounted(ramdisk_dir)
         and ramdisk.files_exist(ramdisk_dir)
         and not reload
+        and not refresh
     ):
         ramdisk.create_emptying_job(verbose=False, cancel_previous=True)
         helper.log(
             "Objects already loaded to RAM disk; deletion timer reset.", verbose=verbose
         )
-        df = ramdisk.load_df(ramdisk_dir)
+        df = ramdisk.load_df(ramdisk_dir, verbose=verbose, tr_a_columns=tr_a_columns)
         return df, df.f_placements_corrected
     else:
-        if not reload:
+        if not reload and not refresh:
             helper.log("Files not loaded to RAM disk.", verbose=verbose)
             helper.log(
                 "Mounting drives and resetting deletion timer...", verbose=verbose
@@ -79,9 +149,9 @@ def setup(
                 verbose=verbose,
             )
         mount_drives_or_update_deletion_timer(ramdisk_dir=ramdisk_dir, verbose=verbose)
-        helper.log("Loading from CSV...", verbose=verbose)
-        df, dffp = get_df_dffp(basepath)
-        ramdisk.save_df(df, ramdisk_dir=ramdisk_dir)
+        df, dffp = get_df_dffp_incremental(
+            basepath, ramdisk_dir, verbose, parallel, tr_a_columns, reload
+        )
         return df, dffp
 
 
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+
+##############################################################################
+# Kaplan-Meier estimates of survival (e.g. of routes, to their ends, or of
+# exits, to returns) from durations and whether each one ended (False if it
+# was cut off, e.g. by dpw_end_dt, while still open). by groups the durations
+# as for groupby, e.g. by=route_ends.rt_end_cat. All the groups are estimated
+# together, from one sort of the durations: one row per group and distinct
+# duration, indexed by the group(s) and "time", with the number at risk then,
+# the events (ended) and censored (not ended) there, and the survival after.
+# Table A.9 only uses cumulative_counts, of the gaps before returns, which all
+# ended: ended only matters for the survival and at-risk estimates
+##############################################################################
+def kaplan_meier(durations, ended=True, by=None):
+    durations = pd.Series(durations)
+    time = durations.to_numpy(dtype="float64", na_value=np.nan)
+    ended = np.broadcast_to(np.asarray(ended, dtype=bool), time.shape)
+    if by is None:
+        codes, groups = np.zeros(len(time), dtype="int64"), None
+    else:
+        grouper = durations.groupby(by, sort=True, observed=True)
+        ngroup = grouper.ngroup().to_numpy(dtype="float64")
+        codes = np.where(np.isnan(ngroup), -1, ngroup).astype("int64")
+        groups = grouper.size().index
+    valid = (codes >= 0) & ~np.isnan(time)
+    order = np.lexsort((time[valid], codes[valid]))
+    codes, time = codes[valid][order], time[valid][order]
+    ended = ended[valid][order].astype("int64")
+    # Runs of the same time in the same group
+    new_run = np.ones(len(time), dtype=bool)
+    new_run[1:] = (codes[1:] != codes[:-1]) | (time[1:] != time[:-1])
+    run_starts = np.flatnonzero(new_run)
+    run_codes = codes[run_starts]
+    exits = np.diff(np.append(run_starts, len(time)))
+    events = np.add.reduceat(ended, run_starts) if len(time) else exits
+    # Everyone in the group who hadn't exited before the run is at risk
+    group_sizes = np.bincount(codes, minlength=1 if groups is None else len(groups))
+    group_starts = np.cumsum(group_sizes) - group_sizes
+    at_risk = group_sizes[run_codes] - (run_starts - group_starts[run_codes])
+    survival = pd.Series(1 - events / at_risk).groupby(run_codes).cumprod()
+    if groups is None:
+        index = pd.Index(time[run_starts], name="time")
+    else:
+        index = pd.MultiIndex.from_frame(
+            groups.take(run_codes).to_frame(index=False).assign(time=time[run_starts])
+        )
+    return pd.DataFrame(
+        {
+            "at_risk": at_risk,
+            "events": events,
+            "censored": exits - events,
+            "survival": survival.to_numpy(),
+        },
+        index=index,
+    )
+
+
+# The estimates at each of times, for each group: a Series over times without
+# groups, otherwise a DataFrame with a row per group and a column per time
+def survival_at(km: pd.DataFrame, times):
+    return _at_times(km, times, km.survival.to_numpy(), "right", 1.0)
+
+
+def at_risk_at(km: pd.DataFrame, times):
+    return _at_times(km, times, km.at_risk.to_numpy(), "left", 0)
+
+
+# Number of durations (ended or not) of at most each of times
+def cumulative_counts(km: pd.DataFrame, times):
+    exits = (km.events + km.censored).to_numpy()
+    codes, starts, _ = _groups(km)
+    counts = np.cumsum(exits)
+    counts -= (counts - exits)[starts][codes]
+    return _at_times(km, times, counts, "right", 0)
+
+
+# The first time the survival is at most a half (NaN if it never is)
+def median_survival(km: pd.DataFrame):
+    halved = km.survival.le(0.5)
+    if km.index.nlevels == 1:
+        return _times(km[halved])[0] if halved.any() else np.nan
+    # Each group's times are sorted, so its first time at most a half is the
+    # first of its rows that are
+    halved_groups = km.index.droplevel("time")[halved]
+    first = ~halved_groups.duplicated()
+    return pd.Series(
+        _times(km[halved])[first], index=halved_groups[first], name="time"
+    ).reindex(km.index.droplevel("time").unique())
+
+
+def _times(g: pd.DataFrame):
+    return g.index.get_level_values("time").to_numpy()
+
+
+# Each row's group (as a code, in the order of the rows, which keep each
+# group's rows together) and where each group's rows start and end (exclusive)
+def _groups(km: pd.DataFrame):
+    if km.index.nlevels == 1:
+        codes = np.zeros(len(km), dtype="int64")
+    else:
+        codes = np.cumsum(~km.index.droplevel("time").duplicated()) - 1
+    n_groups = codes[-1] + 1 if len(codes) else 0
+    starts = np.searchsorted(codes, np.arange(n_groups), "left")
+    ends = np.searchsorted(codes, np.arange(n_groups), "right")
+    return codes, starts, ends
+
+
+# The values of a step function of each group at times, with one binary
+# search of all the groups' times at once. The rows are sorted by group and
+# then time, so (group, time) pairs are compared as group * n + the time's
+# rank among all the times. With side="right", each value is the one at the
+# group's last time at or before each time (or outside before the first);
+# with side="left", the one at its first time at or after it (or outside after
+# the last)
+def _at_times(km: pd.DataFrame, times, values: np.ndarray, side, outside):
+    times = pd.Index(np.asarray(times, dtype="float64"), name="time")
+    codes, starts, ends = _groups(km)
+    n_groups = len(starts) if km.index.nlevels > 1 else 1
+    ranks = np.unique(np.concatenate([_times(km), times]), return_inverse=True)[1]
+    n_ranks = len(ranks) + 1
+    keys = codes * n_ranks + ranks[: len(km)]
+    query_groups = np.repeat(np.arange(n_groups), len(times))
+    queries = query_groups * n_ranks + np.tile(ranks[len(km) :], n_groups)
+    positions = np.searchsorted(keys, queries, side)
+    if side == "right":
+        found = positions > np.append(starts, 0)[query_groups]
+        positions = positions - 1
+    else:
+        found = positions < np.append(ends, 0)[query_groups]
+    values_at = np.append(values, outside)[np.where(found, positions, len(values))]
+    if km.index.nlevels == 1:
+        return pd.Series(values_at, index=times)
+    return pd.DataFrame(
+        values_at.reshape(n_groups, len(times)),
+        index=km.index.droplevel("time").unique(),
+        columns=times,
+    )
@@ -1,5 +1,6 @@
+import numpy as np
 import pandas as pd
-from . import helper, setup
+from . import cleaning, setup
 from pathlib import Path
 
 pd.options.mode.copy_on_write = True
@@ -22,17 +23,15 @@ def _get_trusted_assessments_real(
     dir = Path(basePath)
     if verbose:
         print("Loading Trusted Assessments.csv...")
-    df_tr_a = pd.read_csv(
-        dir / "Trusted Assessments.csv",
-        dtype=tr_a_dtypes,
-        parse_dates=tr_a_dates,
-        dayfirst=True,
+    df_tr_a = pd.read_csv(dir / "Trusted Assessments.csv", dtype=tr_a_dtypes)
+    df_tr_a = cleaning.parse_dates(
+        df_tr_a, tr_a_dates, errors="ignore", verbose=verbose
     )
     # Short column names
     df_tr_a = df_tr_a.rename(columns=tr_a_col_map)
     if do_cleaning:
         # Clean the data
-        df_tr_a = clean_trusted_assessments(df_tr_a)
+        df_tr_a = clean_trusted_assessments(df_tr_a, verbose=verbose)
     # Set the index
     df_tr_a = df_tr_a.set_index("tr_a_id")
     # Load support needs
@@ -47,32 +46,105 @@ def _get_trusted_assessments_real(
             dtype=tr_a_sn_dtypes[prefix],
             usecols=tr_a_sn_dtypes[prefix].keys(),
         )
-        df_tr_a_sn = helper.short_cols(df_tr_a_sn, symbol_replacement="_")
+        df_tr_a_sn = cleaning.short_cols(df_tr_a_sn, symbol_replacement="_")
         df_tr_a_sn = df_tr_a_sn.dropna(subset="tr_a_id").set_index("tr_a_id")
-        df_tr_a = df_tr_a.join(
-            helper.short_cols(pd.get_dummies(df_tr_a_sn, prefix=prefix))
+        # Pack the needs into one column, read through the .needs accessor
+        df_tr_a[prefix] = pack_needs(
+            cleaning.short_cols(pd.get_dummies(df_tr_a_sn, prefix=prefix))
             .groupby(level=0)
-            .any(),
-            on="tr_a_id",
-            how="left",
-        )
+            .any()
+        ).reindex(df_tr_a.index)
     return df_tr_a
 
 
-def clean_trusted_assessments(df_tr_a: pd.DataFrame):
-    df_tr_a.loc[df_tr_a["ntq_expiry_dt"] == "13/12/2021", ["ntq_expiry_dt"]] = (
-        "13/12/2021"
-    )
-    df_tr_a["ntq_expiry_dt"] = pd.to_datetime(
-        df_tr_a["ntq_expiry_dt"], dayfirst=True, errors="coerce"
+def clean_trusted_assessments(df_tr_a: pd.DataFrame, verbose=False):
+    return cleaning.parse_dates(
+        df_tr_a,
+        {
+            "ntq_expiry_dt": cleaning.date_format,
+            "new_tenancy_start_dt": cleaning.date_format,
+        },
+        replacements=tr_a_invalid_dates,
+        errors="coerce",
+        verbose=verbose,
     )
-    df_tr_a.loc[
-        df_tr_a["new_tenancy_start_dt"] == "01/01/1000", ["new_tenancy_start_dt"]
-    ] = pd.NaT
-    df_tr_a["new_tenancy_start_dt"] = pd.to_datetime(
-        df_tr_a["new_tenancy_start_dt"], dayfirst=True, errors="coerce"
+
+
+##########################################################################
+# Support needs, packed into one categorical column per prefix (hsn, fsn).
+# Each category is a set of needs, as the names of their hsn_*/fsn_*
+# columns joined by ";". The first categories are each need on its own, in
+# column order, so every need is listed even if no one has it. A missing
+# value means the assessment had no needs recorded, as the left join of
+# the expanded columns used to give
+##########################################################################
+_needs_separator = ";"
+
+
+def pack_needs(df_needs: pd.DataFrame):
+    cols = list(df_needs.columns)
+    needs = pd.Series(
+        [
+            _needs_separator.join(row_cols)
+            for row_cols in (
+                [col for col, has_need in zip(cols, row) if has_need]
+                for row in df_needs.to_numpy()
+            )
+        ],
+        index=df_needs.index,
+        dtype="object",
     )
-    return df_tr_a
+    categories = cols + sorted(set(needs) - set(cols))
+    return needs.astype(pd.CategoricalDtype(categories))
+
+
+# Read packed support needs as the hsn_*/fsn_* columns they replace, e.g.
+# df.needs["hsn_care_leaver"] is True, False or NaN as that column was
+@pd.api.extensions.register_dataframe_accessor("needs")
+class NeedsAccessor:
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+
+    @property
+    def columns(self):
+        return [col for prefix in self._prefixes() for col in self._cols(prefix)]
+
+    def __getitem__(self, col: str):
+        prefix = col.split("_", 1)[0]
+        if prefix not in self._prefixes() or col not in self._cols(prefix):
+            raise KeyError(col)
+        packed = self._df[prefix]
+        has_need = [
+            col in category.split(_needs_separator)
+            for category in packed.cat.categories
+        ]
+        # Code -1 (no needs recorded) takes the NaN on the end
+        values = np.array(has_need + [np.nan], dtype="object")
+        return pd.Series(values[packed.cat.codes], index=self._df.index, name=col)
+
+    def to_frame(self):
+        return pd.DataFrame({col: self[col] for col in self.columns})
+
+    def _prefixes(self):
+        return [prefix for prefix in tr_a_sn_dtypes if prefix in self._df.columns]
+
+    def _cols(self, prefix: str):
+        return [
+            category
+            for category in self._df[prefix].cat.categories
+            if category.startswith(f"{prefix}_") and _needs_separator not in category
+        ]
+
+
+######################################################
+# Source files: a change to any of these means this
+# dataset has to be reloaded from CSV
+######################################################
+source_files = [
+    "Trusted Assessments.csv",
+    "Trusted Assessments - Support Needs.csv",
+    "Trusted Assessments - Floating Support Needs.csv",
+]
 
 
 tr_a_sn_dtypes = {
@@ -186,16 +258,24 @@ tr_a_dtypes = {
     "Form Status": "category",
 }
 
-tr_a_dates = [
-    "003 Date form completed or updated",
-    "042 Date notice expires",
-    "835 New tenancy start date",
-    "855 Date notice expires",
-    "879 Date form signed off",
-    "Creation Date",
-    "Form Status Date",
-    "Last Updated Date",
-]
+tr_a_dates = dict.fromkeys(
+    [
+        "003 Date form completed or updated",
+        "042 Date notice expires",
+        "835 New tenancy start date",
+        "855 Date notice expires",
+        "879 Date form signed off",
+        "Creation Date",
+        "Form Status Date",
+        "Last Updated Date",
+    ],
+    cleaning.date_format,
+)
+
+tr_a_invalid_dates = {
+    "ntq_expiry_dt": {"13/12/2021": "13/12/2021"},
+    "new_tenancy_start_dt": {"01/01/1000": pd.NaT},
+}
 
 tr_a_col_map = {
     "Pseudo Trusted Assessment Id": "tr_a_id",
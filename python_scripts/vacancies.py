@@ -1,7 +1,7 @@
 import pandas as pd
 import re
 from pathlib import Path
-from . import helper, setup
+from . import cleaning, setup
 from . import vacancies_errors
 
 pd.options.mode.copy_on_write = True
@@ -23,21 +23,22 @@ def _get_vacancies_real(basePath="./Original-CSVs", verbose=True, do_cleaning=Tr
     if verbose:
         print("Loading Vacancies.csv...")
     # Read in the CSV file
-    df_vac = pd.read_csv(
-        dir / "Vacancies.csv",
-        dtype=df_vac_dtypes,
-        parse_dates=df_vac_dates,
-        dayfirst=True,
+    df_vac = pd.read_csv(dir / "Vacancies.csv", dtype=df_vac_dtypes)
+    # Parse the dates, correcting known invalid values if cleaning the data
+    df_vac = cleaning.parse_dates(
+        df_vac,
+        df_vac_dates,
+        replacements=df_vac_invalid_dates if do_cleaning else None,
+        errors="ignore",
+        verbose=verbose,
     )
     # Short column names
-    df_vac = helper.short_cols(df_vac)
+    df_vac = cleaning.short_cols(df_vac)
     # Short referral agency categories
     df_vac = df_vac.rename(columns={"ref_agency_1": "move_on_ref_agency"})
     df_vac["ref_agency_short"] = short_ref_agency(df_vac["ref_agency"])
-    df_vac["ref_agency_short_padded"] = helper.col_padded(df_vac["ref_agency_short"])
+    df_vac["ref_agency_short_padded"] = cleaning.col_padded(df_vac["ref_agency_short"])
     if do_cleaning:
-        # Clean the data
-        df_vac = correct_invalid_dates(df_vac)
         # Correct individual errors found through data exploration
         df_moved_vac, df_vac = vacancies_errors.correct_individual_errors(df_vac)
     else:
@@ -46,21 +47,6 @@ def _get_vacancies_real(basePath="./Original-CSVs", verbose=True, do_cleaning=Tr
     return df_moved_vac, df_vac
 
 
-#########################
-# Correct invalid dates
-#########################
-def correct_invalid_dates(df_vac: pd.DataFrame):
-    # Correct invalid 'Notification Date' value: 'Vacancy Filled Date' is 30/01/2018
-    df_vac.loc[df_vac["notification_dt"] == "07/02/1018", ["notification_dt"]] = (
-        "07/02/2018"
-    )
-    df_vac["notification_dt"] = pd.to_datetime(df_vac["notification_dt"], dayfirst=True)
-    # Correct invalid 'Vacancy Start_dt' value: 'Vacancy Filled Date' is 29/01/2016
-    df_vac.loc[df_vac["vac_start_dt"] == "29/01/0201", ["vac_start_dt"]] = "29/01/2016"
-    df_vac["vac_start_dt"] = pd.to_datetime(df_vac["vac_start_dt"], dayfirst=True)
-    return df_vac
-
-
 ###########################
 # Short referral agencies
 ###########################
@@ -98,6 +84,13 @@ def short_ref_agency(ref_agency: pd.Series):
     )
 
 
+######################################################
+# Source files: a change to any of these means this
+# dataset has to be reloaded from CSV
+######################################################
+source_files = ["Vacancies.csv"]
+
+
 #########################
 # Data types for fields
 #########################
@@ -153,20 +146,35 @@ df_vac_dtypes = {
 ##########################################
 # Fields which should be parsed as dates
 ##########################################
-df_vac_dates = [
-    "Vacancy End Date",
-    "Filled By Referral Interview Date",
-    "Filled By Referral Nomination Date",
-    "Filled By Referral Date",
-    "Filled By Referral Result Date",
-    "Referral Result Set on",
-    "Vacancy Filled Date",
-    "Filled Date Entered On",
-    "Move-On Date",
-    "Moved Out Date",
-    "Notification Date",
-    "Vacancy Start Date",
-    "Start Date Entered On",
-    "Vacancy Close Date Set On",
-    "Filled By Referral - Result Date",
-]
+df_vac_dates = dict.fromkeys(
+    [
+        "Vacancy End Date",
+        "Filled By Referral Interview Date",
+        "Filled By Referral Nomination Date",
+        "Filled By Referral Date",
+        "Filled By Referral Result Date",
+        "Referral Result Set on",
+        "Vacancy Filled Date",
+        "Filled Date Entered On",
+        "Move-On Date",
+        "Moved Out Date",
+        "Notification Date",
+        "Vacancy Start Date",
+        "Start Date Entered On",
+        "Vacancy Close Date Set On",
+        "Filled By Referral - Result Date",
+    ],
+    cleaning.date_format,
+)
+
+
+##############################################
+# Corrections to invalid dates, made before
+# parsing them: {column: {invalid: corrected}}
+##############################################
+df_vac_invalid_dates = {
+    # 'Vacancy Filled Date' is 30/01/2018
+    "Notification Date": {"07/02/1018": "07/02/2018"},
+    # 'Vacancy Filled Date' is 29/01/2016
+    "Vacancy Start Date": {"29/01/0201": "29/01/2016"},
+}